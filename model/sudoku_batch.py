@@ -0,0 +1,62 @@
+from collections import namedtuple
+from itertools import islice
+from multiprocessing import Pool
+import model.sudoku_engines as engines
+import model.sudoku_exceptions as ex
+from model.sudoku_parser import FLAT_SIZES, blocks
+from model.sudoku_solver import Sudoku
+
+BatchResult = namedtuple('BatchResult', 'index solutions error')
+
+
+def read_puzzles(lines):
+    # Разбивает строки на отдельные судоку - списки строк (правила - см.
+    # sudoku_parser.blocks); судоку в одну строку переводится в обычные
+    # строки. Большие входы лучше читать через sudoku_parser.iter_puzzles
+    for block in blocks(l.encode() for l in lines):
+        puzzle = []
+        for _, _, _, line in block:
+            line = line.decode()
+            if not line.startswith('#') and len(line) in FLAT_SIZES and \
+                    len(line.split()) == 1:
+                puzzle.extend(_flat_to_lines(line))
+            else:
+                puzzle.append(line)
+        yield puzzle
+
+
+def _flat_to_lines(line):
+    side = FLAT_SIZES[len(line)] ** 2
+    values = [v if v.isdigit() else '0' for v in line]
+    return [' '.join(values[i:i + side]) for i in range(0, len(line), side)]
+
+
+def _solve_one(task):
+    index, lines, num, first_cond, second_cond, presolve, engine = task
+    try:
+        if isinstance(lines, ex.SudokuException):
+            # ошибка разбора из iter_puzzles(..., errors='yield')
+            raise lines
+        sudoku = Sudoku(lines, first_cond, second_cond)
+        solutions = sudoku.solve(engines.get(engine, sudoku, num),
+                                 presolve=presolve)
+        return BatchResult(index, list(islice(solutions, num)), None)
+    except ex.SudokuException as e:
+        return BatchResult(index, [], str(e))
+
+
+def solve_batch(puzzles, num=1, first_cond=False, second_cond=False,
+                workers=None, chunksize=16, presolve=False, engine='bf'):
+    # Решает много судоку в пуле процессов; результаты отдаются в порядке
+    # входных данных, ошибка в одной судоку не прерывает остальные.
+    # puzzles - списки строк (read_puzzles) или Puzzle и ошибки разбора
+    # (sudoku_parser.iter_puzzles); engine - имя движка (sudoku_engines)
+    tasks = ((i, lines, num, first_cond, second_cond, presolve, engine)
+             for i, lines in enumerate(puzzles))
+    if workers == 1:
+        for task in tasks:
+            yield _solve_one(task)
+        return
+    with Pool(workers) as pool:
+        for result in pool.imap(_solve_one, tasks, chunksize):
+            yield result
@@ -0,0 +1,132 @@
+import os
+import platform
+import random
+import time
+import tracemalloc
+from itertools import islice
+from model.sudoku_engines import ENGINES
+from model.sudoku_gen import SudokuGen
+from model.sudoku_solver import Sudoku
+
+FIXTURES = ('easy', 'medium', 'hard', 'very_hard', '4x4', '16x16')
+# процент заполнения сгенерированных судоку для каждого порядка: чем больше
+# порядок, тем больше подсказок, чтобы полный перебор оставался конечным
+CORPUS_PERCENT = {2: 40, 3: 35, 4: 55, 5: 70}
+# метрики, которые сравниваются с эталоном (больше - хуже)
+COMPARED = ('first_ms', 'all_ms', 'nodes')
+
+_tests_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          os.pardir, 'tests')
+
+
+def fixtures(names=FIXTURES):
+    for name in names:
+        path = os.path.join(_tests_dir, name + '.txt')
+        yield name, [Sudoku.get_from_file(path)]
+
+
+def corpus(order, count, seed=0):
+    # судоку из генератора с фиксированным seed; состояние random
+    # восстанавливается, чтобы не влиять на остальной код
+    state = random.getstate()
+    random.seed(seed)
+    try:
+        return [Sudoku(SudokuGen(order, CORPUS_PERCENT[order]))
+                for _ in range(count)]
+    finally:
+        random.setstate(state)
+
+
+def measure(sudokus, engine, limit=1000, memory=True, repeat=3):
+    # Для каждой судоку: время до первого решения, время перебора
+    # (не больше limit решений), число узлов перебора и пиковая память.
+    # Из repeat замеров времени берётся наименьший, как в timeit.
+    # Память меряется отдельным прогоном, так как tracemalloc сильно
+    # замедляет перебор
+    first = total = 0.0
+    nodes = solutions = peak = 0
+    for sudoku in sudokus:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            next(sudoku.solve(engine), None)
+            times.append(time.perf_counter() - start)
+        first += min(times)
+
+        times = []
+        for _ in range(repeat):
+            solver = sudoku._solver(engine, {})
+            start = time.perf_counter()
+            found = sum(1 for _ in islice(solver.solve(False), limit))
+            times.append(time.perf_counter() - start)
+        total += min(times)
+        solutions += found
+        nodes += solver.nodes
+
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            try:
+                sum(1 for _ in islice(sudoku.solve(engine, False), limit))
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+            finally:
+                tracemalloc.stop()
+
+    n = len(sudokus)
+    result = {
+        'puzzles': n,
+        'puzzles_per_sec': round(n / first, 2) if first else None,
+        'first_ms': round(first * 1000 / n, 3),
+        'all_ms': round(total * 1000 / n, 3),
+        'nodes': nodes,
+        'solutions': solutions,
+    }
+    if memory:
+        result['peak_kb'] = round(peak / 1024, 1)
+    return result
+
+
+def run(engines=('bf', 'dlx'), orders=(2, 3, 4, 5), count=10, seed=0,
+        limit=1000, memory=True, repeat=3, names=FIXTURES):
+    sets = list(fixtures(names))
+    for order in orders:
+        sets.append(('gen{}'.format(order), corpus(order, count, seed)))
+
+    results = {}
+    for name, sudokus in sets:
+        results[name] = {engine: measure(sudokus, ENGINES[engine],
+                                         limit, memory, repeat)
+                         for engine in engines}
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'seed': seed,
+            'count': count,
+            'limit': limit,
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+
+def compare(current, baseline, threshold=0.2, min_ms=0.5):
+    # Возвращает список регрессий: метрики, которые выросли больше,
+    # чем в (1 + threshold) раз по сравнению с эталоном; времена,
+    # выросшие меньше чем на min_ms, считаются шумом
+    regressions = []
+    for name, engines in sorted(current['results'].items()):
+        for engine, metrics in sorted(engines.items()):
+            base = baseline.get('results', {}).get(name, {}).get(engine)
+            if not base:
+                continue
+            for key in COMPARED:
+                old, new = base.get(key), metrics.get(key)
+                if old is None or new is None:
+                    continue
+                if key.endswith('_ms') and new - old < min_ms:
+                    continue
+                if new > old * (1 + threshold):
+                    regressions.append(
+                        '{} {} {}: {} -> {}'.format(
+                            name, engine, key, old, new))
+    return regressions
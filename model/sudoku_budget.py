@@ -0,0 +1,81 @@
+import time
+from collections import namedtuple
+
+# Итог перебора, остановленного бюджетом: причина ('deadline', 'nodes',
+# 'solutions' или 'cancelled'), сколько найдено решений, сколько узлов
+# перебрано, сколько секунд прошло и SolveStats решателя (или None)
+BudgetExhausted = namedtuple('BudgetExhausted',
+                             'reason solutions nodes elapsed stats')
+
+
+class CancelToken:
+    # Флаг отмены, который можно выставить из другого потока или из
+    # обработчика сигнала; перебор проверяет его на каждом узле
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Budget:
+    # Ограничения одного перебора: время (timeout, в секундах, отсчёт
+    # с начала перебора), число узлов, число решений и флаг отмены.
+    # Когда ограничение срабатывает, перебор просто перестаёт отдавать
+    # решения, а в self.result появляется BudgetExhausted
+
+    # время проверяется раз в столько узлов
+    CLOCK_EVERY = 64
+
+    def __init__(self, timeout=None, max_nodes=None, max_solutions=None,
+                 token=None):
+        self.timeout = timeout
+        self.max_nodes = max_nodes
+        self.max_solutions = max_solutions
+        self.token = token
+        self.result = None
+        self.solutions = 0
+        self._start = None
+        self._deadline = None
+        self._stats = None
+
+    @property
+    def exhausted(self):
+        return self.result is not None
+
+    def start(self, stats=None):
+        if self._start is None:
+            self._start = time.monotonic()
+            if self.timeout is not None:
+                self._deadline = self._start + self.timeout
+        self._stats = stats
+
+    def check(self, nodes):
+        # вызывается перед каждым узлом (nodes - сколько уже перебрано);
+        # True - перебор нужно остановить
+        if self.result is not None:
+            return True
+        if self.token is not None and self.token.cancelled:
+            return self._stop('cancelled', nodes)
+        if self.max_nodes is not None and nodes >= self.max_nodes:
+            return self._stop('nodes', nodes)
+        if self._deadline is not None and \
+                not nodes % self.CLOCK_EVERY and \
+                time.monotonic() > self._deadline:
+            return self._stop('deadline', nodes)
+        return False
+
+    def solution(self, nodes):
+        # вызывается после каждого отданного решения
+        self.solutions += 1
+        if self.max_solutions is not None and \
+                self.solutions >= self.max_solutions:
+            return self._stop('solutions', nodes)
+        return False
+
+    def _stop(self, reason, nodes):
+        self.result = BudgetExhausted(
+            reason, self.solutions, nodes,
+            time.monotonic() - (self._start or time.monotonic()),
+            self._stats)
+        return True
@@ -0,0 +1,208 @@
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from hashlib import blake2b
+from itertools import islice
+import model.sudoku_engines as engines
+from model.sudoku_grid import Grid
+from model.sudoku_solver_bf import SudokuBF
+
+
+class SolutionCache:
+    # Кэш решений перед Sudoku.solve: в памяти (LRU на maxsize судоку)
+    # и, если указан path, в sqlite-файле, который держится в пределах
+    # max_disk_bytes (вытесняются давно не использованные записи).
+    # Для каждой судоку хранятся найденные решения, признак того, что
+    # перебор закончен, и позиция перебора SudokuBF (см. SudokuBF.state),
+    # поэтому запрос -n 5 продолжает закэшированный -n 3 с места
+    # остановки. Продолженный перебор отдаёт решения без повторов, но не
+    # обязательно в том же порядке, что и перебор с начала. Для других
+    # алгоритмов позиции нет, и уже известные решения перебираются заново
+    def __init__(self, maxsize=1024, path=None, max_disk_bytes=64 << 20):
+        self.maxsize = maxsize
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(os.path.abspath(path))
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS solutions ('
+                'key TEXT PRIMARY KEY, complete INTEGER, data TEXT, '
+                'size INTEGER, used REAL, state TEXT)')
+            columns = [row[1] for row in self._db.execute(
+                'PRAGMA table_info(solutions)')]
+            if 'state' not in columns:
+                # файл, созданный до того, как стала храниться позиция
+                self._db.execute(
+                    'ALTER TABLE solutions ADD COLUMN state TEXT')
+            self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def solve(self, sudoku, num=None, solver=SudokuBF, materialize=True,
+              **options):
+        # Отдаёт не больше num решений (все, если num is None): сначала
+        # закэшированные, потом найденные продолженным перебором; при
+        # materialize=False - только заполненные клетки (r, c, n)
+        solutions = self._solve(sudoku, num, solver, options)
+        if materialize:
+            return solutions
+        givens = sudoku._field
+        return (tuple((r, c, n) for r, c, n in sol.filled()
+                      if not givens[r, c])
+                for sol in solutions)
+
+    def _solve(self, sudoku, num, solver, options):
+        key = self.key(sudoku, solver, options)
+        solutions, complete, state = self._get(key)
+        if complete or (num is not None and len(solutions) >= num):
+            self.hits += 1
+            for sol in islice(solutions, num):
+                yield _copy(sol)
+            return
+
+        self.misses += 1
+        solutions = list(solutions)
+        known = len(solutions)
+        tracker = None
+        options = dict(options)
+        if self._resumable(sudoku, solver, options):
+            # решатель отдаётся tracker'у вместо Checkpoint, чтобы потом
+            # снять с него позицию
+            tracker = options['checkpoint'] = _Tracker()
+            if state is not None and state.get('solutions') == known:
+                options['resume'] = state
+            else:
+                state = None
+        saved = known
+
+        def save(complete):
+            state = None
+            if not complete and tracker is not None and \
+                    tracker.solver is not None:
+                state = tracker.solver.state()
+            self._put(key, solutions, complete, state)
+            return len(solutions)
+
+        try:
+            for sol in solutions:
+                yield _copy(sol)
+            found = sudoku.solve(solver, **options)
+            if state is None:
+                # перебор детерминирован, поэтому уже известные решения
+                # просто пропускаются
+                found = islice(found, known, None)
+            budget = options.get('budget')
+            while num is None or len(solutions) < num:
+                sol = next(found, None)
+                if sol is None:
+                    # перебор, остановленный бюджетом, не закончен
+                    complete = budget is None or not budget.exhausted
+                    break
+                solutions.append(_copy(sol))
+                if len(solutions) == num:
+                    # после последнего нужного решения генератор могут
+                    # больше не продолжить (islice), поэтому запись
+                    # сохраняется до него, пока перебор стоит на решении
+                    saved = save(False)
+                yield sol
+        finally:
+            if len(solutions) > saved or complete:
+                save(complete)
+
+    @staticmethod
+    def _resumable(sudoku, solver, options):
+        # позицию умеет сохранять только итеративный SudokuBF
+        if isinstance(solver, str):
+            solver = engines.get(solver, sudoku)
+        return solver is SudokuBF and options.get('iterative', True) and \
+            'checkpoint' not in options and 'resume' not in options
+
+    @staticmethod
+    def key(sudoku, solver=SudokuBF, options=None):
+        # Нормализованная судоку: числа, доп. условия, цвета (без учёта
+        # порядка), алгоритм и его параметры, от которых зависит порядок
+        # решений (статистика и бюджет на него не влияют)
+        options = {k: v for k, v in (options or {}).items()
+                   if k not in ('stats', 'budget', 'checkpoint', 'resume')}
+        colors = None
+        if sudoku.second_cond:
+            colors = sorted(sorted(tup) for tup in sudoku.second_colors)
+        data = json.dumps([sudoku._field.to_lists(), bool(sudoku.first_cond),
+                           colors, getattr(solver, '__name__', solver),
+                           sorted(options.items())])
+        return blake2b(data.encode(), digest_size=16).hexdigest()
+
+    def _get(self, key):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+        if self._db is not None:
+            row = self._db.execute(
+                'SELECT complete, data, state FROM solutions WHERE key = ?',
+                (key,)).fetchone()
+            if row is not None:
+                self._db.execute(
+                    'UPDATE solutions SET used = ? WHERE key = ?',
+                    (time.time(), key))
+                self._db.commit()
+                entry = [Grid.from_rows(sol) for sol in
+                         json.loads(row[1])], bool(row[0]), \
+                    json.loads(row[2]) if row[2] else None
+                self._remember(key, entry)
+                return entry
+        return [], False, None
+
+    def _put(self, key, solutions, complete, state=None):
+        self._remember(key, (solutions, complete, state))
+        if self._db is None:
+            return
+        data = json.dumps([sol.to_lists() for sol in solutions])
+        state = json.dumps(state) if state is not None else None
+        size = len(data) + len(state or '')
+        if size > self.max_disk_bytes:
+            return
+        self._db.execute(
+            'INSERT OR REPLACE INTO solutions VALUES (?, ?, ?, ?, ?, ?)',
+            (key, int(complete), data, size, time.time(), state))
+        total = self._db.execute(
+            'SELECT SUM(size) FROM solutions').fetchone()[0]
+        oldest = self._db.execute(
+            'SELECT key, size FROM solutions ORDER BY used')
+        evicted = []
+        for old_key, size in oldest:
+            if total <= self.max_disk_bytes:
+                break
+            evicted.append((old_key,))
+            total -= size
+        self._db.executemany('DELETE FROM solutions WHERE key = ?', evicted)
+        self._db.commit()
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+
+class _Tracker:
+    # то, что решатель ждёт от Checkpoint, но без записи в файл
+    solver = None
+
+    def start(self, solver):
+        self.solver = solver
+
+    def due(self, nodes):
+        return False
+
+
+def _copy(field):
+    # закэшированные таблицы не отдаются наружу, чтобы их не испортили
+    return field.copy()
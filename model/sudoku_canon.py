@@ -0,0 +1,230 @@
+from collections import Counter
+from hashlib import blake2b
+from itertools import chain
+from operator import itemgetter
+
+
+def canonical_form(field, order):
+    # Каноническая форма - наименьшая (лексикографически) из эквивалентных
+    # таблиц: транспонирование, перестановки строк внутри полос и самих
+    # полос, то же для столбцов, перенумерация чисел (числа нумеруются в
+    # порядке появления, пустые клетки остаются нулями).
+    #
+    # Клетки сравниваются в порядке "растущего квадрата": на шаге k
+    # выбираются k-я строка и k-й столбец результата и открываются клетки
+    # (0..k-1, k) и (k, 0..k). Открытые клетки зависят только от уже
+    # сделанного выбора, поэтому после каждого шага можно оставить лишь
+    # варианты с наименьшим префиксом.
+    #
+    # Одних префиксов мало: в первом квадрате все числа разные, и
+    # префиксы у всех вариантов совпадают, пока он не открыт целиком.
+    # Поэтому на каждом шаге берутся только строки (столбцы) с
+    # наименьшим инвариантом (см. _Lines) - тем, что не меняется от
+    # преобразований. Наименьшая таблица ищется среди так выбранных, и
+    # форма остаётся канонической: у эквивалентных таблиц выбираются
+    # соответствующие друг другу строки. Варианты, которые переводятся
+    # друг в друга симметриями таблицы (их много у разреженных таблиц),
+    # склеиваются, см. _arranged.
+    #
+    # Возвращает (таблица, хэш, преобразование); преобразование -
+    # (transposed, rows, cols, labels), где
+    # canon[i][j] == labels[t[rows[i]][cols[j]]], t - исходная таблица,
+    # транспонированная, если transposed
+    side = order ** 2
+    tables = ([bytes(row) for row in field],
+              [bytes(col) for col in zip(*field)])
+    lines = (_Lines(tables[0], order), _Lines(tables[1], order))
+    # таблицу или транспонированную - по тому же правилу
+    shapes = [(sorted(lines[t].static), sorted(lines[1 - t].static))
+              for t in (0, 1)]
+    states = [(t, (), (), {0: 0}) for t in (0, 1)
+              if shapes[t] == min(shapes)]
+    for _ in range(side):
+        best = None
+        extended = []
+        for t, rows, cols, labels in states:
+            table = tables[t]
+            col_choices = lines[1 - t].allowed(cols)
+            for r in lines[t].allowed(rows):
+                row = table[r]
+                for c in col_choices:
+                    new_cols = cols + (c,)
+                    values = [table[i][c] for i in rows] + \
+                        [row[j] for j in new_cols]
+                    # новые метки заводим отдельно, чтобы не копировать
+                    # словарь для заведомо худших вариантов
+                    added = {}
+                    prefix = []
+                    # tie - префикс пока совпадает с лучшим
+                    tie = best is not None
+                    for v in values:
+                        label = labels.get(v)
+                        if label is None:
+                            label = added.get(v)
+                            if label is None:
+                                label = added[v] = len(labels) + len(added)
+                        if tie:
+                            b = best[len(prefix)]
+                            if label > b:
+                                break
+                            tie = label == b
+                        prefix.append(label)
+                    if len(prefix) < len(values):
+                        continue
+                    if best is None or prefix < best:
+                        best = prefix
+                        extended = []
+                    new_labels = dict(labels)
+                    new_labels.update(added)
+                    extended.append((t, rows + (r,), new_cols, new_labels))
+        unique = {}
+        for state in extended:
+            t, rows, cols, _ = state
+            unique.setdefault(
+                _arranged(tables[t], rows, cols, order), state)
+        states = list(unique.values())
+
+    t, rows, cols, labels = states[0]
+    labels = dict(labels)
+    for v in range(1, side + 1):
+        if v not in labels:
+            labels[v] = len(labels)
+    table = tables[t]
+    canon = [[labels[table[i][j]] for j in cols] for i in rows]
+    return canon, grid_hash(canon), (bool(t), rows, cols, labels)
+
+
+class _Lines:
+    # Инварианты строк таблицы (для столбцов - строк транспонированной).
+    # Две строки a и b связаны отображением a[c] -> b[c] по столбцам, где
+    # заполнены обе; длины его циклов и цепочек (и число клеток,
+    # заполненных только в одной из строк) не меняются от перестановок
+    # столбцов и перенумерации чисел. Инвариант строки - число заполненных
+    # клеток и такие связи со строками её полосы; на шаге перебора к нему
+    # добавляются связи с уже выбранными строками
+    def __init__(self, table, order):
+        self.table = table
+        self.order = order
+        self._pairs = {}
+        self._allowed = {}
+        self.static = []
+        for x in range(order ** 2):
+            start = x // order * order
+            self.static.append((
+                len(table[x]) - table[x].count(0),
+                sorted(self.pair(x, y) for y in range(start, start + order)
+                       if y != x)))
+
+    def pair(self, a, b):
+        key = a, b
+        sig = self._pairs.get(key)
+        if sig is None:
+            sig = self._pairs[key] = _pair(self.table[a], self.table[b])
+        return sig
+
+    def allowed(self, chosen):
+        # строки, которые можно поставить на следующее место; у многих
+        # вариантов выбранные строки одни и те же
+        found = self._allowed.get(chosen)
+        if found is None:
+            choices = _choices(chosen, len(chosen), self.order)
+            keys = [(self.static[x], [self.pair(x, y) for y in chosen])
+                    for x in choices]
+            least = min(keys)
+            found = self._allowed[chosen] = \
+                [x for x, key in zip(choices, keys) if key == least]
+        return found
+
+
+def _pair(a, b):
+    only_a = only_b = 0
+    nxt = {}
+    for x, y in zip(a, b):
+        if x and y:
+            nxt.setdefault(x, []).append(y)
+        elif x:
+            only_a += 1
+        elif y:
+            only_b += 1
+    targets = Counter(y for ys in nxt.values() for y in ys)
+    if any(len(ys) > 1 for ys in nxt.values()) or \
+            any(n > 1 for n in targets.values()):
+        # в строке повторяются числа - только степени вершин
+        degrees = sorted((len(nxt.get(d, ())), targets[d])
+                         for d in set(nxt) | set(targets))
+        return only_a, only_b, 1, degrees
+    nxt = {x: ys[0] for x, ys in nxt.items()}
+    paths = []
+    for x in list(nxt):
+        if x not in targets:
+            n = 0
+            while x in nxt:
+                x = nxt.pop(x)
+                n += 1
+            paths.append(n)
+    cycles = []
+    while nxt:
+        x, y = nxt.popitem()
+        n = 1
+        while y != x:
+            y = nxt.pop(y)
+            n += 1
+        cycles.append(n)
+    return only_a, only_b, 0, [sorted(cycles), sorted(paths)]
+
+
+def _arranged(table, rows, cols, order):
+    # Таблица, где сначала идут выбранные строки и столбцы, потом
+    # остальные (см. _rest), а числа перенумерованы в порядке появления.
+    # Если у двух вариантов она одна и та же, то любое продолжение
+    # одного из них даёт тот же результат, что и такое же продолжение
+    # другого
+    pick = itemgetter(*_rest(cols, order))
+    raw = bytes(chain.from_iterable(
+        pick(table[r]) for r in _rest(rows, order)))
+    labels = bytearray(256)
+    for i, v in enumerate(v for v in dict.fromkeys(raw) if v):
+        labels[v] = i + 1
+    return raw.translate(labels)
+
+
+def _rest(chosen, order):
+    # выбранные строки (столбцы), потом оставшиеся строки недобранной
+    # полосы, потом нетронутые полосы, всё по возрастанию
+    k = len(chosen)
+    rest = list(chosen)
+    if k % order:
+        start = chosen[k - k % order] // order * order
+        rest += [x for x in range(start, start + order) if x not in chosen]
+    used = {x // order for x in chosen}
+    rest += [x for x in range(order ** 2) if x // order not in used]
+    return rest
+
+
+def _choices(chosen, k, order):
+    # строки (столбцы), которые можно поставить на место k
+    if k % order:
+        band = chosen[k - k % order] // order
+        start = band * order
+        return [x for x in range(start, start + order) if x not in chosen]
+    used = {x // order for x in chosen}
+    return [x for x in range(order ** 2) if x // order not in used]
+
+
+def from_canonical(canon, transform):
+    # восстанавливает исходную таблицу по канонической и преобразованию
+    transposed, rows, cols, labels = transform
+    back = {v: k for k, v in labels.items()}
+    side = len(canon)
+    table = [[0] * side for _ in range(side)]
+    for i, r in enumerate(rows):
+        for j, c in enumerate(cols):
+            table[r][c] = back[canon[i][j]]
+    if transposed:
+        table = [list(col) for col in zip(*table)]
+    return table
+
+
+def grid_hash(field):
+    return blake2b(bytes(v for row in field for v in row),
+                   digest_size=8).hexdigest()
@@ -0,0 +1,68 @@
+import json
+import os
+import time
+from model.sudoku_exceptions import SudokuCheckpointError
+
+
+class Checkpoint:
+    # Сохраняет позицию перебора SudokuBF (см. SudokuBF.state) в
+    # JSON-файл раз в interval секунд (None - только по вызову save()).
+    # Файл сначала пишется рядом во временный и потом переименовывается,
+    # поэтому прерванная запись не портит прошлую позицию. before_save
+    # вызывается перед каждой записью (например, сбрасывает буфер вывода,
+    # чтобы в нём были все отданные решения) и возвращает словарь,
+    # который сохраняется вместе с позицией под ключом 'extra'
+
+    # время проверяется раз в столько узлов
+    CLOCK_EVERY = 1024
+
+    def __init__(self, path, interval=60.0, before_save=None):
+        self.path = path
+        self.interval = interval
+        self.before_save = before_save
+        self.solver = None
+        self.saves = 0
+        self._next = None
+
+    def start(self, solver):
+        # вызывается решателем перед перебором
+        self.solver = solver
+        if self.interval is not None:
+            self._next = time.monotonic() + self.interval
+
+    def due(self, nodes):
+        return self._next is not None and \
+            not nodes % self.CLOCK_EVERY and \
+            time.monotonic() >= self._next
+
+    def save(self):
+        # False - перебор ещё не начинался, сохранять нечего
+        if self.solver is None:
+            return False
+        state = self.solver.state()
+        if self.before_save is not None:
+            state['extra'] = self.before_save()
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self.saves += 1
+        if self.interval is not None:
+            self._next = time.monotonic() + self.interval
+        return True
+
+
+def load(path):
+    # позиция, сохранённая Checkpoint
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except (OSError, ValueError) as e:
+        raise SudokuCheckpointError(
+            'Cannot read the saved search: {}'.format(e))
+    if not isinstance(state, dict) or 'stack' not in state:
+        raise SudokuCheckpointError(
+            '{} is not a saved search position'.format(path))
+    return state
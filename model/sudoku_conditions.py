@@ -0,0 +1,84 @@
+class FirstCondPropagator:
+    # На v и ^ уголках должно быть ровно 2 одинаковых числа: для каждого
+    # уголка считаем, сколько раз встретилось каждое число, сколько чисел
+    # встретилось дважды и сколько клеток уголка ещё не заполнено
+    def __init__(self, side):
+        cen = side // 2
+        a = list(range(cen + 1)) + list(reversed(range(cen)))
+        b = list(reversed(range(cen, side))) + list(range(cen + 1, side))
+        self._corners = {}
+        for k, rows in enumerate((a, b)):
+            for i, j in zip(rows, range(side)):
+                self._corners.setdefault((i, j), []).append(k)
+
+        self._counts = [[0] * (side + 1), [0] * (side + 1)]
+        self._pairs = [0, 0]
+        self._over = [0, 0]
+        self._left = [side, side]
+
+    def assign(self, r, c, n):
+        for k in self._corners.get((r, c), ()):
+            counts = self._counts[k]
+            counts[n] += 1
+            if counts[n] == 2:
+                self._pairs[k] += 1
+            elif counts[n] == 3:
+                self._pairs[k] -= 1
+                self._over[k] += 1
+            self._left[k] -= 1
+        return self.feasible()
+
+    def unassign(self, r, c, n):
+        for k in self._corners.get((r, c), ()):
+            counts = self._counts[k]
+            if counts[n] == 2:
+                self._pairs[k] -= 1
+            elif counts[n] == 3:
+                self._pairs[k] += 1
+                self._over[k] -= 1
+            counts[n] -= 1
+            self._left[k] += 1
+
+    def feasible(self):
+        for k in range(2):
+            if self._over[k] or self._pairs[k] > 1:
+                return False
+            if not self._left[k] and self._pairs[k] != 1:
+                return False
+        return True
+
+
+class SecondCondPropagator:
+    # Суммы чисел в клетках одного цвета должны быть равны: для каждого
+    # цвета хранится частичная сумма и число незаполненных клеток, откуда
+    # получаются границы [sum + left, sum + left * side] итоговой суммы.
+    # Если границы разных цветов не пересекаются, ветку можно отсекать
+    def __init__(self, side, colors):
+        self._side = side
+        self._weights = {}
+        for g, tup in enumerate(colors):
+            for num in tup:
+                cell = divmod(num, side)
+                weights = self._weights.setdefault(cell, {})
+                weights[g] = weights.get(g, 0) + 1
+        self._weights = {cell: tuple(w.items())
+                         for cell, w in self._weights.items()}
+        self._sums = [0] * len(colors)
+        self._left = [len(tup) for tup in colors]
+
+    def assign(self, r, c, n):
+        for g, m in self._weights.get((r, c), ()):
+            self._sums[g] += n * m
+            self._left[g] -= m
+        return self.feasible()
+
+    def unassign(self, r, c, n):
+        for g, m in self._weights.get((r, c), ()):
+            self._sums[g] -= n * m
+            self._left[g] += m
+
+    def feasible(self):
+        low = max(s + left for s, left in zip(self._sums, self._left))
+        high = min(s + left * self._side
+                   for s, left in zip(self._sums, self._left))
+        return low <= high
@@ -0,0 +1,54 @@
+from model.sudoku_solver_bf import SudokuBF
+from model.sudoku_solver_bitmask import SudokuBitmask
+from model.sudoku_solver_dlx import SudokuDLX
+
+# Движки перебора по именам. Движок - класс, который создаётся как
+# engine(side, order, field, propagators=(), stats=None, budget=None)
+# и умеет solve(materialize) (решения - Grid или кортежи (r, c, n)
+# заполненных клеток) и count(limit); в атрибуте nodes - число
+# испробованных кандидатов. Новый движок добавляется через register
+ENGINES = {'bf': SudokuBF, 'dlx': SudokuDLX, 'bitmask': SudokuBitmask}
+AUTO = 'auto'
+
+# Выбор движка для auto: SudokuBitmask, если заполнена хотя бы такая
+# доля клеток, иначе SudokuDLX. Доли - точки, где времена сравниваются
+# на сгенерированных судоку (bench.corpus, по 4 на точку):
+# * 9x9: с единственным решением и 17-21 подсказками DLX быстрее в 2-8
+#   раз, с 24 и больше - bitmask в 2-30 раз
+# * 16x16: при 45% DLX быстрее в 2 раза (при 40% - в 50 раз), при 50% -
+#   bitmask в 6 раз
+# * 25x25: при 50% bitmask не успевает за 4 с (DLX - 0.2 с), при 55% -
+#   в 6 раз быстрее DLX
+# Для больших порядков доля взята с запасом. Число нужных решений точки
+# не сдвигало: при переборе всех решений выигрывает тот же движок.
+# SudokuBF в auto не выбирается - он нужен для --checkpoint и --jobs
+AUTO_MIN_FILLED = {2: 0.0, 3: 0.27, 4: 0.48, 5: 0.53}
+AUTO_MIN_FILLED_LARGE = 0.6
+
+
+def register(name, engine):
+    if name == AUTO:
+        raise ValueError('"{}" is reserved'.format(AUTO))
+    ENGINES[name] = engine
+
+
+def names():
+    return sorted(ENGINES) + [AUTO]
+
+
+def get(name, sudoku=None, num=None):
+    # Класс движка по имени; для auto нужна судоку (Sudoku), см. choose
+    if name == AUTO:
+        return choose(sudoku, num)
+    try:
+        return ENGINES[name]
+    except KeyError:
+        raise ValueError('Unknown solver engine: {}'.format(name))
+
+
+def choose(sudoku, num=None):
+    # num - сколько решений нужно (None - все); пока не влияет на выбор
+    field = sudoku.field
+    filled = 1 - field.count(0) / len(field) ** 2
+    threshold = AUTO_MIN_FILLED.get(field.order, AUTO_MIN_FILLED_LARGE)
+    return SudokuBitmask if filled >= threshold else SudokuDLX
@@ -8,3 +8,21 @@ class SudokuWrongInputError(SudokuException):
 
 class SudokuGeneratorError(SudokuException):
     pass
+
+
+class SudokuNoSolutionError(SudokuException):
+    pass
+
+
+class SudokuParseError(SudokuWrongInputError):
+    # line - номер строки (с 1), offset - смещение в байтах от начала входа
+    def __init__(self, message, line=None, offset=None):
+        if line is not None:
+            message += ' (line {}, byte {})'.format(line, offset)
+        super().__init__(message)
+        self.line = line
+        self.offset = offset
+
+
+class SudokuCheckpointError(SudokuException):
+    pass
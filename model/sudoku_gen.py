@@ -1,18 +1,33 @@
-from random import randrange
-from copy import deepcopy
+from random import randrange, shuffle
 from collections import Counter
+from itertools import chain
+from operator import itemgetter
+from model.sudoku_canon import canonical_form
+from model.sudoku_conditions import FirstCondPropagator, \
+    SecondCondPropagator
 from model.sudoku_exceptions import SudokuGeneratorError
+from model.sudoku_grid import Grid
+from model.sudoku_solver_bf import SudokuBF
 
 
 class SudokuGen:
     def __init__(self, order=3, percent=30,
-                 first_cond=False, second_colors=None):
+                 first_cond=False, second_colors=None,
+                 unique=False, givens=None, minimal=False,
+                 max_transforms=20000, budget=None):
         if order < 2:
             raise SudokuGeneratorError(
                 'Size cannot be less than 2')
         self.order = order
         self.side = order ** 2
         self.percent = percent
+        self.max_transforms = max_transforms
+        self.transforms_tried = 0
+        # Budget или None: ограничивает перемешивание и проверки
+        # единственности решения; когда он исчерпан - SudokuGeneratorError
+        self.budget = budget
+        if budget is not None:
+            budget.start()
 
         if first_cond and self.order % 2 == 0:
             raise SudokuGeneratorError('Sudoku should have odd size to be '
@@ -23,11 +38,9 @@ class SudokuGen:
             if len(second_colors) > 4:
                 raise SudokuGeneratorError(
                     'More than 4 colors in the second condition')
-            if second_colors == ((-1, ),):
-                second_colors = tuple(
-                    [tuple(n) for n in [[randrange(self.side**2)
-                                         for _ in range(randrange(1, 5))]
-                                        for _ in range(randrange(2, 5))]])
+            self._random_colors = second_colors == ((-1, ),)
+            if self._random_colors:
+                second_colors = self._make_colors()
             else:
                 for tup in second_colors:
                     if not all(-1 < val < self.side**2 for val in tup):
@@ -37,56 +50,100 @@ class SudokuGen:
             self.second_cond = len(second_colors) > 1
         else:
             self.second_cond = False
+            self._random_colors = False
         self.second_colors = second_colors
 
-        self.table = [[((i * order + i // order + j) % self.side + 1)
-                       for j in range(self.side)]
-                      for i in range(self.side)]
+        # перемешанная таблица не строится на каждом шаге: клетка (r, c)
+        # берётся из клетки (rows[r], cols[c]) исходной таблицы _base
+        # (транспонированной, если _transposed), а числа заменяются по
+        # _digits. Таблица собирается один раз, после всех перестановок
+        self._base = Grid(order, ((i * order + i // order + j) % self.side + 1
+                                  for i in range(self.side)
+                                  for j in range(self.side)))
+        self._rows = list(range(self.side))
+        self._cols = list(range(self.side))
+        self._transposed = False
+        self._digits = None
         self._mix()
-        self.ref_table = deepcopy(self.table)
-        self._create()
+        self.table = self._build()
+        self.ref_table = self.table.copy()
+        if unique or minimal or givens is not None:
+            if minimal:
+                givens = 0
+            elif givens is None:
+                givens = round(self.side * self.side / 100 * self.percent)
+            self._create_unique(givens)
+        else:
+            self._create()
+
+    def _cell(self, r, c):
+        # клетка перемешанной таблицы
+        i, j = self._rows[r], self._cols[c]
+        if self._transposed:
+            i, j = j, i
+        return self._base[i, j]
+
+    def _build(self):
+        side = self.side
+        flat = self._base.flat
+        pick = itemgetter(*self._cols)
+        if self._transposed:
+            lines = (flat[i::side] for i in self._rows)
+        else:
+            lines = (flat[i * side:(i + 1) * side] for i in self._rows)
+        table = Grid(self.order, chain.from_iterable(map(pick, lines)))
+        if self._digits:
+            table = table.relabel(self._digits)
+        return table
 
     def _transpose(self):
-        self.table = list(map(list, zip(*self.table)))
+        # строки новой таблицы - столбцы старой
+        self._rows, self._cols = self._cols, self._rows
+        self._transposed = not self._transposed
 
-    def _swap_rows_in_house(self):
-        area = randrange(self.order)
-        line1 = randrange(self.order)
-        line2 = randrange(self.order)
+    @staticmethod
+    def _swap_in_house(lines, order):
+        area = randrange(order)
+        line1 = randrange(order)
+        line2 = randrange(order)
         while line1 == line2:
-            line2 = randrange(self.order)
+            line2 = randrange(order)
+        a, b = area * order + line1, area * order + line2
+        lines[a], lines[b] = lines[b], lines[a]
 
-        n1 = area * self.order + line1
-        n2 = area * self.order + line2
-        self.table[n1], self.table[n2] = self.table[n2], self.table[n1]
+    @staticmethod
+    def _swap_houses(lines, order):
+        house1 = randrange(order)
+        house2 = randrange(order)
+        while house1 == house2:
+            house2 = randrange(order)
+        a, b = house1 * order, house2 * order
+        lines[a:a + order], lines[b:b + order] = \
+            lines[b:b + order], lines[a:a + order]
+
+    def _swap_rows_in_house(self):
+        self._swap_in_house(self._rows, self.order)
 
     def _swap_columns_in_house(self):
-        self._transpose()
-        self._swap_rows_in_house()
-        self._transpose()
+        self._swap_in_house(self._cols, self.order)
 
     def _swap_rows_houses(self):
-        house1 = randrange(self.order)
-        house2 = randrange(self.order)
-        while house1 == house2:
-            house2 = randrange(self.order)
-
-        for i in range(self.order):
-            n1, n2 = house1 * self.order + i, house2 * self.order + i
-            self.table[n1], self.table[n2] = self.table[n2], self.table[n1]
+        self._swap_houses(self._rows, self.order)
 
     def _swap_columns_area(self):
-        SudokuGen._transpose(self)
-        SudokuGen._swap_rows_houses(self)
-        SudokuGen._transpose(self)
+        self._swap_houses(self._cols, self.order)
 
-    def _check_v_n(self):
+    def _v_n(self):
         cen = self.side // 2
         a = list(range(cen + 1)) + list(reversed(range(cen)))
         b = list(reversed(range(cen, self.side))) + \
             list(range(cen + 1, self.side))
-        v = [self.table[i][j] for i, j in zip(a, range(self.side))]
-        n = [self.table[i][j] for i, j in zip(b, range(self.side))]
+        v = [self._cell(i, j) for i, j in zip(a, range(self.side))]
+        n = [self._cell(i, j) for i, j in zip(b, range(self.side))]
+        return v, n
+
+    def _check_v_n(self):
+        v, n = self._v_n()
         c_v = Counter(v)
         c_n = Counter(n)
         return self._check_corner(c_v) and self._check_corner(c_n)
@@ -97,15 +154,14 @@ class SudokuGen:
         return common[0][1] == 2 and common[1][1] < 2
 
     def _check_second_cond(self):
-        side = len(self.table)
+        side = self.side
         sums = [sum(value) for value in
-                [[SudokuGen._get_cell(num, self.table, side) for num in tup]
+                [[self._get_cell(num, side) for num in tup]
                  for tup in self.second_colors]]
         return all(x == sums[0] for x in sums)
 
-    @staticmethod
-    def _get_cell(num, field, side):
-        return field[num // side][num % side]
+    def _get_cell(self, num, side):
+        return self._cell(num // side, num % side)
 
     def _mix(self):
         mix_func = [self._transpose, self._swap_rows_in_house,
@@ -114,16 +170,177 @@ class SudokuGen:
         for i in range(100):
             id_func = randrange(len(mix_func))
             mix_func[id_func]()
-        while not ((not self.first_cond or self._check_v_n())
-                   and (not self.second_cond or self._check_second_cond())):
+        # расположение клеток меняется случайными перестановками, пока не
+        # выполнится первое условие; для второго условия после этого
+        # перебором с отсечениями ищется перенумерация чисел. Всего
+        # пробуется не больше max_transforms преобразований
+        self.transforms_tried = 0
+        penalty = self._v_n_penalty() if self.first_cond else 0
+        while True:
+            if not penalty:
+                if not self.second_cond:
+                    return
+                relabel = self._find_relabel()
+                if relabel:
+                    self._digits = relabel
+                    return
+                if self._random_colors:
+                    self.second_colors = self._make_colors()
+                # при такой расстановке перенумерации нет - уходим от неё
+                # случайной перестановкой, даже если первое условие
+                # нарушится
+                self._spend_transform()
+                mix_func[randrange(len(mix_func))]()
+                if self.first_cond:
+                    penalty = self._v_n_penalty()
+                continue
+            self._spend_transform()
+            saved = self._rows[:], self._cols[:], self._transposed
             id_func = randrange(len(mix_func))
             mix_func[id_func]()
+            if self.first_cond:
+                # перестановки, отдаляющие от первого условия, отменяются
+                new_penalty = self._v_n_penalty()
+                if new_penalty > penalty:
+                    self._rows, self._cols, self._transposed = saved
+                else:
+                    penalty = new_penalty
+
+    def _v_n_penalty(self):
+        # 0, если на обоих уголках ровно одна пара одинаковых чисел
+        penalty = 0
+        for corner in self._v_n():
+            extra = [k - 1 for k in Counter(corner).values() if k > 1]
+            penalty += abs(sum(extra) - 1) + sum(k - 1 for k in extra if k > 1)
+        return penalty
+
+    def _spend_transform(self):
+        self.transforms_tried += 1
+        if self.transforms_tried > self.max_transforms:
+            raise SudokuGeneratorError(
+                'Cannot satisfy the conditions: tried {} transforms'.format(
+                    self.max_transforms))
+        if self.budget is not None and \
+                self.budget.check(self.transforms_tried):
+            self._stopped()
+
+    def _stopped(self):
+        raise SudokuGeneratorError('Generation stopped: {}'.format(
+            self.budget.result.reason))
+
+    def _make_colors(self):
+        return tuple(
+            [tuple(n) for n in [[randrange(self.side**2)
+                                 for _ in range(randrange(1, 5))]
+                                for _ in range(randrange(2, 5))]])
+
+    def _find_relabel(self):
+        # ищет перестановку чисел, при которой суммы всех цветов равны:
+        # числа, стоящие в покрашенных клетках, перебираются по убыванию
+        # числа вхождений. Разность сумм первого и каждого другого цвета
+        # должна стать нулём; её наименьшее и наибольшее возможное значение
+        # для ещё не выбранных чисел оцениваются перестановочным
+        # неравенством, и ветка отсекается, если ноль вне этих границ
+        counts = [Counter(self._get_cell(num, self.side)
+                          for num in tup) for tup in self.second_colors]
+        digits = sorted({d for c in counts for d in c},
+                        key=lambda d: -sum(c[d] for c in counts))
+        diffs = [{d: counts[0][d] - c[d] for d in digits} for c in counts[1:]]
+        partial = [0] * len(diffs)
+        free = set(range(1, self.side + 1))
+        relabel = {}
+        # на одну расстановку тратится не больше side**2 попыток
+        nodes = [self.side ** 2]
+
+        def bounds_ok(k):
+            values = sorted(free)
+            for p, diff in zip(partial, diffs):
+                coef = sorted(diff[d] for d in digits[k:])
+                neg = [e for e in coef if e < 0]
+                pos = [e for e in reversed(coef) if e > 0]
+                low = sum(e * v for e, v in zip(neg, reversed(values))) + \
+                    sum(e * v for e, v in zip(pos, values))
+                high = sum(e * v for e, v in zip(neg, values)) + \
+                    sum(e * v for e, v in zip(pos, reversed(values)))
+                if not low <= -p <= high:
+                    return False
+            return True
+
+        def search(k):
+            if k == len(digits):
+                return True
+            d = digits[k]
+            values = list(free)
+            shuffle(values)
+            for v in values:
+                if not nodes[0]:
+                    return False
+                nodes[0] -= 1
+                self._spend_transform()
+                free.remove(v)
+                relabel[d] = v
+                for i, diff in enumerate(diffs):
+                    partial[i] += v * diff[d]
+                if bounds_ok(k + 1) and search(k + 1):
+                    return True
+                for i, diff in enumerate(diffs):
+                    partial[i] -= v * diff[d]
+                free.add(v)
+                del relabel[d]
+            return False
+
+        if not bounds_ok(0) or not search(0):
+            return None
+        rest = list(free)
+        shuffle(rest)
+        for d in range(1, self.side + 1):
+            if d not in relabel:
+                relabel[d] = rest.pop()
+        return relabel
+
+    def canonical(self):
+        # (таблица, хэш, преобразование), см. canonical_form;
+        # цвета второго условия при этом не учитываются
+        return canonical_form(self.table, self.order)
 
     def _create(self):
         num = self.side * self.side
         i = round(num / 100 * (100 - self.percent))
         for _ in range(i):
             a, b = randrange(self.side), randrange(self.side)
-            while self.table[a][b] == 0:
+            while self.table[a, b] == 0:
                 a, b = randrange(self.side), randrange(self.side)
-            self.table[a][b] = 0
+            self.table[a, b] = 0
+
+    def _create_unique(self, givens):
+        # клетки убираются по одной в случайном порядке; клетка остаётся,
+        # если без неё появляется второе решение. Второе решение ищется
+        # как любое решение, где в этой клетке стоит другое число, поэтому
+        # перебор останавливается на первом же найденном
+        cells = [(a, b) for a in range(self.side) for b in range(self.side)]
+        shuffle(cells)
+        left = len(cells)
+        for a, b in cells:
+            if left <= givens:
+                break
+            value = self.table[a, b]
+            self.table[a, b] = 0
+            if self._has_other_solution(a, b, value):
+                self.table[a, b] = value
+            else:
+                left -= 1
+
+    def _has_other_solution(self, a, b, value):
+        props = []
+        if self.first_cond:
+            props.append(FirstCondPropagator(self.side))
+        if self.second_cond:
+            props.append(SecondCondPropagator(self.side, self.second_colors))
+        solver = SudokuBF(self.side, self.order, self.table,
+                          propagators=props, excluded=((a, b, value),),
+                          budget=self.budget)
+        found = solver.count(1) > 0
+        # прерванный перебор ничего не говорит о втором решении
+        if self.budget is not None and self.budget.exhausted:
+            self._stopped()
+        return found
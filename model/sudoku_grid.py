@@ -0,0 +1,166 @@
+from itertools import chain
+
+
+class Grid:
+    # Таблица судоку в одном плоском bytearray (клетка (r, c) - байт
+    # r * side + c, 0 - пустая клетка). Строки и столбцы отдаются как
+    # memoryview без копирования: grid[r] - строка (в неё можно писать,
+    # поэтому grid[r][c] работает как у списка списков), grid[r, c] -
+    # быстрый доступ к клетке. Хэш считается по содержимому, поэтому
+    # таблицу нельзя менять, пока она лежит в множестве или словаре
+    __slots__ = ('order', 'side', '_cells')
+
+    def __init__(self, order, cells=None):
+        side = order ** 2
+        if side > 255:
+            raise ValueError('Grid supports sides up to 255')
+        self.order = order
+        self.side = side
+        if cells is None:
+            self._cells = bytearray(side * side)
+        else:
+            self._cells = bytearray(cells)
+            if len(self._cells) != side * side:
+                raise ValueError('Expected {} cells, got {}'.format(
+                    side * side, len(self._cells)))
+
+    @classmethod
+    def from_rows(cls, rows, order=None):
+        rows = list(rows)
+        if order is None:
+            order = int(round(len(rows) ** 0.5))
+        return cls(order, chain.from_iterable(rows))
+
+    @classmethod
+    def of(cls, field, order=None):
+        # сама таблица, если это уже Grid, иначе Grid из списка строк
+        if isinstance(field, Grid):
+            return field
+        return cls.from_rows(field, order)
+
+    def copy(self):
+        new = Grid.__new__(Grid)
+        new.order, new.side, new._cells = \
+            self.order, self.side, self._cells[:]
+        return new
+
+    __copy__ = copy
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def __reduce__(self):
+        return Grid, (self.order, bytes(self._cells))
+
+    def __len__(self):
+        return self.side
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            r, c = key
+            return self._cells[r * self.side + c]
+        return self.row(key)
+
+    def __setitem__(self, key, value):
+        if isinstance(key, tuple):
+            r, c = key
+            self._cells[r * self.side + c] = value
+        else:
+            self.row(key)[:] = bytes(value)
+
+    def __iter__(self):
+        return self.rows()
+
+    def __eq__(self, other):
+        if isinstance(other, Grid):
+            return self._cells == other._cells
+        if isinstance(other, list):
+            return self.to_lists() == other
+        return NotImplemented
+
+    def __lt__(self, other):
+        # тот же порядок, что у списков строк
+        if isinstance(other, Grid):
+            return self._cells < other._cells
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(bytes(self._cells))
+
+    def __repr__(self):
+        return 'Grid({}, {!r})'.format(self.order, bytes(self._cells))
+
+    @property
+    def flat(self):
+        # все клетки построчно, без копирования
+        return memoryview(self._cells)
+
+    def row(self, r):
+        side = self.side
+        return memoryview(self._cells)[r * side:(r + 1) * side]
+
+    def col(self, c):
+        return memoryview(self._cells)[c::self.side]
+
+    def house(self, h):
+        # числа квадрата h (нумерация слева направо, сверху вниз)
+        order, side = self.order, self.side
+        view = memoryview(self._cells)
+        start = (h // order) * order * side + (h % order) * order
+        return chain.from_iterable(
+            view[start + i * side:start + i * side + order]
+            for i in range(order))
+
+    def rows(self):
+        for r in range(self.side):
+            yield self.row(r)
+
+    def cols(self):
+        for c in range(self.side):
+            yield self.col(c)
+
+    def houses(self):
+        for h in range(self.side):
+            yield self.house(h)
+
+    def count(self, value):
+        return self._cells.count(value)
+
+    def filled(self):
+        # (r, c, n) для заполненных клеток
+        side = self.side
+        return [(i // side, i % side, n)
+                for i, n in enumerate(self._cells) if n]
+
+    def update(self, cells):
+        # заполняет клетки (r, c, n)
+        data, side = self._cells, self.side
+        for r, c, n in cells:
+            data[r * side + c] = n
+        return self
+
+    def swap_rows(self, a, b):
+        data, side = self._cells, self.side
+        a, b = a * side, b * side
+        data[a:a + side], data[b:b + side] = \
+            data[b:b + side], data[a:a + side]
+
+    def transposed(self):
+        side = self.side
+        new = Grid(self.order)
+        for c in range(side):
+            new._cells[c * side:(c + 1) * side] = self._cells[c::side]
+        return new
+
+    def relabel(self, mapping):
+        # новая таблица, где каждое число n заменено на mapping[n]
+        table = bytearray(range(256))
+        for k, v in mapping.items():
+            table[k] = v
+        new = Grid.__new__(Grid)
+        new.order, new.side, new._cells = \
+            self.order, self.side, self._cells.translate(table)
+        return new
+
+    def to_lists(self):
+        return [list(row) for row in self.rows()]
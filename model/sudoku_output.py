@@ -0,0 +1,219 @@
+import operator
+import os
+from collections import namedtuple
+from model.sudoku_grid import Grid
+
+# Форматы вывода решений:
+# * text - как раньше ("Solution N:" и таблица), но строки собираются по
+#   готовым строкам клеток и пишутся в поток большими кусками
+# * packed - двоичный файл: заголовок, потом записи одинаковой длины, по
+#   одной на решение; в записи все клетки, по 4 бита на клетку (n - 1,
+#   для таблиц до 16x16) или по байту (больше 16x16)
+# * packed-delta - то же, но в записи только клетки, пустые в задаче
+#   (в порядке номеров клеток)
+# Заголовок: MAGIC, версия, порядок, режим (PACKED или DELTA) и клетки
+# задачи по байту на клетку. Прочитать файл - iter_packed
+FORMATS = ('text', 'packed', 'packed-delta')
+
+MAGIC = b'SDKP'
+VERSION = 1
+PACKED = 0
+DELTA = 1
+# сколько байт копится перед записью в поток
+BUFFER = 1 << 18
+
+Header = namedtuple('Header', 'order mode givens cells record')
+
+# n -> n - 1 (в записях нет пустых клеток, поэтому 16 входит в 4 бита)
+_DEC = bytes((n - 1) % 256 for n in range(256))
+_HIGH = bytes(((n - 1) << 4) % 256 for n in range(256))
+# байт записи -> число из старших или младших 4 бит
+_UNHIGH = bytes((b >> 4) + 1 for b in range(256))
+_UNLOW = bytes((b & 15) + 1 for b in range(256))
+_UNDEC = bytes((n + 1) % 256 for n in range(256))
+
+_cell_strs = {}
+
+
+def format_grid(grid):
+    # таблица текстом, как раньше в sudoku.p_sol: по len(str(side)) + 2
+    # символа на клетку, каждая строка заканчивается переводом строки
+    side = len(grid)
+    strs = _cell_strs.get(side)
+    if strs is None:
+        width = len(str(side)) + 2
+        strs = _cell_strs[side] = \
+            ['{0:{1}}'.format(v, width) for v in range(side + 1)]
+    get = strs.__getitem__
+    return ''.join([''.join(map(get, row)) + '\n' for row in grid])
+
+
+def format_cells(cells):
+    # заполненные клетки (r, c, n) по одной в строке
+    return ''.join(['{} {} {}\n'.format(r, c, n) for r, c, n in cells])
+
+
+def writer(fmt, stream, givens=None, delta=False, buffer=BUFFER, start=0,
+           header=True):
+    # TextWriter или PackedWriter для формата fmt; для двоичных форматов
+    # stream должен быть двоичным, givens - задача. start - сколько решений
+    # уже выведено (нумерация продолжается), header=False - решения
+    # дописываются в файл, где заголовок уже есть
+    if fmt == 'text':
+        return TextWriter(stream, delta, buffer, start)
+    if fmt in ('packed', 'packed-delta'):
+        return PackedWriter(stream, givens, fmt == 'packed-delta',
+                            buffer, start, header)
+    raise ValueError('Unknown output format: {}'.format(fmt))
+
+
+class _Writer:
+    def __init__(self, stream, buffer=BUFFER, start=0):
+        self.stream = stream
+        self.count = start
+        self._buffer = buffer
+        self._parts = []
+        self._size = 0
+
+    def _add(self, part):
+        self._parts.append(part)
+        self._size += len(part)
+        if self._size >= self._buffer:
+            self.flush()
+
+    def flush(self):
+        if self._parts:
+            self.stream.write(self._join(self._parts))
+            self._parts = []
+            self._size = 0
+        self.stream.flush()
+
+    close = flush
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+
+class TextWriter(_Writer):
+    # Решения текстом в том же виде, что и print в режиме "s";
+    # delta=True - решения приходят списками клеток (r, c, n)
+    _join = ''.join
+
+    def __init__(self, stream, delta=False, buffer=BUFFER, start=0):
+        super().__init__(stream, buffer, start)
+        self._format = format_cells if delta else format_grid
+
+    def write(self, sol):
+        self.count += 1
+        self._add('Solution {}:\n{}\n'.format(self.count, self._format(sol)))
+
+
+class PackedWriter(_Writer):
+    # Решения (Grid) записями одинаковой длины, см. начало модуля
+    _join = b''.join
+
+    def __init__(self, stream, givens, delta=False, buffer=BUFFER,
+                 start=0, header=True):
+        super().__init__(stream, buffer, start)
+        givens = Grid.of(givens)
+        # если пустых клеток нет, записи были бы пустыми и их нельзя было
+        # бы посчитать при чтении
+        self.mode = DELTA if delta and givens.count(0) else PACKED
+        self.header = _header(givens, self.mode)
+        if self.mode == DELTA:
+            cells = self.header.cells
+            pick = operator.itemgetter(*cells)
+            self._pick = (lambda flat: bytes(pick(flat))) \
+                if len(cells) > 1 else (lambda flat: bytes((pick(flat),)))
+        else:
+            self._pick = bytes
+        self._nibbles = givens.side <= 16
+        if header:
+            self._add(MAGIC + bytes((VERSION, givens.order, self.mode)) +
+                      bytes(givens.flat))
+
+    def write(self, sol):
+        self.count += 1
+        values = self._pick(Grid.of(sol).flat)
+        if self._nibbles:
+            if len(values) % 2:
+                values += b'\x01'
+            values = bytes(map(operator.or_, values[0::2].translate(_HIGH),
+                               values[1::2].translate(_DEC)))
+        else:
+            values = values.translate(_DEC)
+        self._add(values)
+
+
+def read_header(stream):
+    # Header из начала двоичного потока; cells - номера клеток в записи,
+    # record - длина записи в байтах
+    head = stream.read(len(MAGIC) + 3)
+    if len(head) < len(MAGIC) + 3 or not head.startswith(MAGIC):
+        raise ValueError('Not a packed Sudoku solutions file')
+    version, order, mode = head[len(MAGIC):]
+    if version != VERSION or mode not in (PACKED, DELTA):
+        raise ValueError('Unsupported packed file version or mode')
+    givens = stream.read(order ** 4)
+    if len(givens) != order ** 4:
+        raise ValueError('Packed file is truncated')
+    givens = Grid(order, givens)
+    return _header(givens, mode)
+
+
+def iter_packed(source, chunk=BUFFER):
+    # Решения (Grid) из файла форматов packed и packed-delta;
+    # source - путь или двоичный поток
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            yield from iter_packed(f, chunk)
+        return
+    header = read_header(source)
+    record = header.record
+    nibbles = header.givens.side <= 16
+    givens = bytes(header.givens.flat)
+    cells = header.cells
+    full = header.mode == PACKED
+    order = header.order
+    chunk = max(1, chunk // record) * record
+    rest = b''
+    while True:
+        data = source.read(chunk)
+        if not data:
+            break
+        data = rest + data
+        end = len(data) - len(data) % record
+        rest = data[end:]
+        for pos in range(0, end, record):
+            rec = data[pos:pos + record]
+            if nibbles:
+                values = bytearray(2 * record)
+                values[0::2] = rec.translate(_UNHIGH)
+                values[1::2] = rec.translate(_UNLOW)
+                del values[len(cells):]
+            else:
+                values = bytearray(rec.translate(_UNDEC))
+            if full:
+                yield Grid(order, values)
+            else:
+                grid = bytearray(givens)
+                for i, n in zip(cells, values):
+                    grid[i] = n
+                yield Grid(order, grid)
+    if rest:
+        raise ValueError('Packed file is truncated')
+
+
+def _header(givens, mode):
+    if mode == DELTA:
+        cells = [i for i, n in enumerate(givens.flat) if not n]
+    else:
+        cells = list(range(givens.side ** 2))
+    if givens.side <= 16:
+        record = (len(cells) + 1) // 2
+    else:
+        record = len(cells)
+    return Header(givens.order, mode, givens, cells, record)
@@ -0,0 +1,108 @@
+import heapq
+import queue
+from multiprocessing import Pool
+from model.sudoku_budget import Budget
+from model.sudoku_conditions import FirstCondPropagator, \
+    SecondCondPropagator
+from model.sudoku_solver_bf import SudokuBF
+
+# Перебор делится на подзадачи - частичные заполнения (кандидаты, которые
+# добавляются к заданным клеткам). Процесс перебирает свою подзадачу не
+# больше чем SPLIT_NODES узлов; если она не закончилась, непройденная часть
+# (ещё не испробованные кандидаты на каждом уровне стека) возвращается
+# как новые подзадачи, так что большие поддеревья делятся сами, а уже
+# сделанная работа не повторяется
+SPLIT_NODES = 20000
+
+
+def solve_parallel(sudoku, workers=None, ordered=False, materialize=True,
+                   split_nodes=SPLIT_NODES):
+    # Все решения sudoku, найденные в пуле процессов. ordered=True - в
+    # порядке путей перебора (одинаковом от запуска к запуску), иначе -
+    # по мере нахождения
+    for sols in _run(sudoku, workers, split_nodes, False, ordered):
+        for cells in sols:
+            if not materialize:
+                yield cells
+                continue
+            yield sudoku._field.copy().update(cells)
+
+
+def count_parallel(sudoku, workers=None, split_nodes=SPLIT_NODES):
+    return sum(_run(sudoku, workers, split_nodes, True, False))
+
+
+def _run(sudoku, workers, split_nodes, count, ordered):
+    spec = (sudoku._side, sudoku._order, sudoku._field, sudoku.first_cond,
+            sudoku.second_colors if sudoku.second_cond else None)
+    results = queue.Queue()
+    if workers == 1:
+        pool = None
+
+        def submit(path, prefix):
+            results.put(_subtree((spec, path, prefix, count, split_nodes)))
+    else:
+        pool = Pool(workers)
+
+        def submit(path, prefix):
+            pool.apply_async(
+                _subtree, ((spec, path, prefix, count, split_nodes),),
+                callback=results.put, error_callback=results.put)
+
+    # pending - пути незаконченных подзадач, ready - найденные решения,
+    # ждущие, пока закончатся подзадачи с меньшими путями
+    pending = []
+    done = set()
+    ready = []
+    try:
+        submit((), ())
+        heapq.heappush(pending, ())
+        outstanding = 1
+        while outstanding:
+            res = results.get()
+            if isinstance(res, Exception):
+                raise res
+            outstanding -= 1
+            path, found, frontier = res
+            done.add(path)
+            for sub_path, prefix in frontier:
+                heapq.heappush(pending, sub_path)
+                submit(sub_path, prefix)
+                outstanding += 1
+            if not ordered:
+                yield found
+                continue
+            heapq.heappush(ready, (path, found))
+            while pending and pending[0] in done:
+                done.discard(heapq.heappop(pending))
+            while ready and (not pending or ready[0][0] < pending[0]):
+                yield heapq.heappop(ready)[1]
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+
+def _subtree(task):
+    # Перебирает одну подзадачу; возвращает (путь, решения или их число,
+    # непройденные подзадачи)
+    (side, order, field, first_cond, colors), path, prefix, count, \
+        split_nodes = task
+    field = field.copy().update(prefix)
+    props = []
+    if first_cond:
+        props.append(FirstCondPropagator(side))
+    if colors:
+        props.append(SecondCondPropagator(side, colors))
+    budget = Budget(max_nodes=split_nodes)
+    solver = SudokuBF(side, order, field, propagators=props, budget=budget)
+    solutions = solver.solve(False)
+    if count:
+        found = sum(1 for _ in solutions)
+    else:
+        found = [prefix + cells for cells in solutions]
+    frontier = []
+    if budget.exhausted:
+        frontier = [(path + sub_path, prefix + cells)
+                    for sub_path, cells in solver.frontier()]
+    return path, found, frontier
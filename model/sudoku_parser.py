@@ -0,0 +1,259 @@
+import io
+import mmap
+import os
+import re
+from collections import namedtuple
+from contextlib import contextmanager
+from model.sudoku_exceptions import SudokuParseError
+from model.sudoku_grid import Grid
+from model.utils import str_to_tuples
+
+# Разобранная судоку: порядок, Grid, цвета второго условия (или None),
+# номер строки и смещение в байтах, с которых она начинается
+Puzzle = namedtuple('Puzzle', 'order field colors line offset')
+
+# длина судоку, записанной в одну строку -> порядок
+FLAT_SIZES = {o ** 4: o for o in range(2, 4)}
+
+# цифра -> её значение, остальные символы -> 0 (пустая клетка)
+_FLAT = bytearray(256)
+for _d in range(10):
+    _FLAT[ord('0') + _d] = _d
+_FLAT = bytes(_FLAT)
+
+# для каждой длины строки - словарь токен -> число, чтобы не вызывать
+# isdigit() и int() для каждой клетки
+_tables = {}
+# сколько разных обозначений пустой клетки запоминается в словаре
+TOKEN_CACHE = 1024
+_token = re.compile(rb'\S+')
+
+
+def iter_puzzles(source, errors='raise'):
+    # Лениво отдаёт судоку (Puzzle) из входа, где их может быть много
+    # (правила разбиения - см. blocks). source - путь к файлу
+    # (читается через mmap), файл (текстовый или двоичный), bytes или mmap,
+    # либо последовательность строк. errors='yield' - вместо того, чтобы
+    # остановиться на ошибке, отдать SudokuParseError вместо этой судоку
+    # и продолжить со следующей
+    with _open(source) as lines:
+        for block in blocks(lines):
+            try:
+                yield _parse_block(block)
+            except SudokuParseError as e:
+                if errors != 'yield':
+                    raise
+                yield e
+
+
+def parse_puzzle(source):
+    # Весь вход - одна судоку (пустые строки пропускаются)
+    with _open(source) as lines:
+        block = []
+        line_no = offset = 0
+        for raw in lines:
+            line_no += 1
+            line = raw.strip()
+            if line:
+                block.append((line_no, offset, raw, line))
+            offset += len(raw)
+    return _parse_block(block)
+
+
+@contextmanager
+def _open(source):
+    # итератор строк bytes из source
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            try:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                # пустой файл или файл, который нельзя отобразить
+                yield iter(f)
+                return
+            with mm:
+                yield iter(mm.readline, b'')
+    elif isinstance(source, mmap.mmap):
+        yield iter(source.readline, b'')
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        yield iter(io.BytesIO(source))
+    elif hasattr(source, 'buffer'):
+        # текстовый файл или sys.stdin - читаем байты без декодирования
+        yield iter(source.buffer)
+    else:
+        yield (_line(l) for l in source)
+
+
+def _line(line):
+    # строки из списка могут быть str и без перевода строки
+    if not isinstance(line, bytes):
+        line = line.encode()
+    return line if line.endswith(b'\n') else line + b'\n'
+
+
+def blocks(lines):
+    # Разбивает строки на судоку; каждая судоку - список
+    # (номер строки, смещение, строка, она же без пробелов по краям) без
+    # пустых строк. Поддерживаются:
+    # * судоку в одну строку (81 или 16 символов, пустые клетки - 0 . *)
+    # * обычные блоки строк; блок заканчивается, когда набрано столько
+    #   строк, сколько чисел в первой строке, или на пустой строке
+    # Строки с решёткой относятся к судоку, после которой они идут
+    # (до пустой строки), иначе - к следующей судоку
+    pending = []
+    current = []
+    done = None
+    length = rows = 0
+    line_no = offset = 0
+    for raw in lines:
+        line_no += 1
+        line = raw.strip()
+        entry = (line_no, offset, raw, line)
+        offset += len(raw)
+        if not line:
+            if done is not None:
+                yield done
+                done = None
+            if current:
+                yield pending + current
+                pending, current = [], []
+            continue
+
+        if line.startswith(b'#'):
+            if done is not None:
+                done.append(entry)
+            elif current:
+                current.append(entry)
+            else:
+                pending.append(entry)
+            continue
+
+        if done is not None:
+            yield done
+            done = None
+
+        if not current and len(line) in FLAT_SIZES and \
+                len(line.split()) == 1:
+            yield pending + [entry]
+            pending = []
+            continue
+
+        if not current:
+            length = len(line.split())
+            rows = 0
+        current.append(entry)
+        rows += 1
+        if rows == length:
+            done = pending + current
+            pending, current = [], []
+
+    if done is not None:
+        yield done
+    if current:
+        yield pending + current
+
+
+class _Values(dict):
+    # числа 0..length и уже встреченные обозначения пустой клетки;
+    # новые токены, кроме чисел, запоминаются как пустые клетки, а
+    # для чисел остаётся KeyError (см. _slow_row)
+    def __missing__(self, token):
+        if token.isdigit() or len(self) >= TOKEN_CACHE:
+            raise KeyError(token)
+        self[token] = 0
+        return 0
+
+
+def _values(length):
+    table = _tables.get(length)
+    if table is None:
+        table = _Values((str(n).encode(), n) for n in range(length + 1))
+        _tables[length] = table
+    return table
+
+
+def _parse_block(block):
+    colors = None
+    cells = bytearray()
+    length = order = rows = 0
+    table = None
+    start = None
+    for line_no, offset, raw, line in block:
+        if line.startswith(b'#'):
+            st = str_to_tuples(
+                line.strip(b'#').strip().decode('utf-8', 'replace'))
+            if st:
+                colors = st
+            continue
+        if start is None:
+            start = line_no, offset
+
+        if not rows and len(line) in FLAT_SIZES and \
+                len(line.split()) == 1:
+            order = FLAT_SIZES[len(line)]
+            length = order ** 2
+            values = line.translate(_FLAT)
+            if max(values) > length:
+                pos = next(i for i, v in enumerate(values) if v > length)
+                raise SudokuParseError(
+                    'The input Sudoku is not valid: value {} should be '
+                    'not bigger than {}'.format(values[pos], length),
+                    line_no, offset + raw.index(line) + pos)
+            cells += values
+            rows = length
+            continue
+
+        tokens = line.split()
+        if not rows:
+            length = len(tokens)
+            order = int(length ** 0.5)
+            if length != order ** 2:
+                raise SudokuParseError(
+                    'The input Sudoku has unusual row length '
+                    '(expected {}, got {})'.format(order ** 2, length),
+                    line_no, offset)
+            if length > 255:
+                raise SudokuParseError(
+                    'The input Sudoku is too big (row length {}, at most '
+                    '255 is supported)'.format(length), line_no, offset)
+            table = _values(length)
+        elif len(tokens) != length:
+            raise SudokuParseError(
+                'The input Sudoku is not valid (expected {} values in a '
+                'row, got {})'.format(length, len(tokens)),
+                line_no, offset)
+        try:
+            cells += bytes(map(table.__getitem__, tokens))
+        except KeyError:
+            cells += bytes(_slow_row(tokens, table, length, line_no,
+                                     offset, raw))
+        rows += 1
+
+    if start is None:
+        raise SudokuParseError('The input Sudoku is empty')
+    if rows == 1:
+        raise SudokuParseError(
+            'The input Sudoku is not valid (too small)', *start)
+    if rows != length:
+        raise SudokuParseError(
+            'The input Sudoku has unusual size '
+            '(expected {0}x{0}, got {1} rows)'.format(length, rows), *start)
+    return Puzzle(order, Grid(order, cells), colors, *start)
+
+
+def _slow_row(tokens, table, length, line_no, offset, raw):
+    # токены не из таблицы: не цифры - пустые клетки, числа с ведущими
+    # нулями - как обычно, а слишком большие - ошибка
+    row = []
+    for k, token in enumerate(tokens):
+        value = table.get(token)
+        if value is None:
+            value = int(token) if token.isdigit() else 0
+            if value > length:
+                pos = [m.start() for m in _token.finditer(raw)][k]
+                raise SudokuParseError(
+                    'The input Sudoku is not valid: value {} should be '
+                    'not bigger than {}'.format(value, length),
+                    line_no, offset + pos)
+        row.append(value)
+    return row
@@ -0,0 +1,319 @@
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import multiprocessing
+import model.sudoku_exceptions as ex
+from model.sudoku_budget import Budget, CancelToken
+from model.sudoku_gen import SudokuGen
+from model.sudoku_solver import Sudoku
+from model.utils import str_to_tuples
+
+# Сервер принимает запросы в виде JSON, по одному в строке, и отвечает
+# тоже строками JSON (в каждом ответе - id запроса):
+# * {"op": "solve", "sudoku": "<как в файле>" или [[...], ...],
+#    "num": 1, "first": false, "second": false, "timeout": 10}
+#   -> {"solution": [[...], ...]} на каждое решение по мере нахождения,
+#   потом {"done": true, "count": N, "stopped": null | "deadline" | ...}
+# * {"op": "generate", "size": 3, "percent": 30, "first": false,
+#    "colors": "0,1_2", "unique": false, "timeout": 10}
+#   -> {"sudoku": [[...]], "solution": [[...]], "colors": [[...]] | null}
+# * {"op": "health"} -> число запросов в очереди и в работе, задержки
+# Ошибка в запросе - {"error": "..."}.
+#
+# Решение и генерация идут в пуле из workers процессов; одновременно
+# выполняется не больше workers запросов, ещё max_queue ждут своей
+# очереди, а остальные сразу получают {"error": "busy"}. Решения идут из
+# процесса через очередь на STREAM_BUFFER элементов, поэтому процесс
+# ждёт, если клиент читает медленно; отключение клиента прерывает перебор
+
+STREAM_BUFFER = 64
+# как часто (в секундах) ожидание решений проверяет, жив ли процесс
+POLL_INTERVAL = 0.2
+# сколько последних задержек хранится для процентилей
+LATENCY_WINDOW = 1000
+
+
+class SudokuServer:
+    def __init__(self, workers=None, max_queue=100, timeout=30.0):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.waiting = 0
+        self.running = 0
+        self.requests = 0
+        self.errors = 0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._slots = None
+        self._pool = None
+        self._manager = None
+        self._server = None
+        self._tasks = set()
+
+    async def start(self, host='127.0.0.1', port=8765, path=None):
+        # процессы пула запускаются по мере надобности, уже после приёма
+        # соединений, и при fork унаследовали бы их сокеты (клиент не
+        # увидел бы закрытия соединения)
+        methods = multiprocessing.get_all_start_methods()
+        ctx = multiprocessing.get_context(
+            'forkserver' if 'forkserver' in methods else 'spawn')
+        self._slots = asyncio.Semaphore(self.workers)
+        self._pool = ProcessPoolExecutor(self.workers, mp_context=ctx)
+        self._manager = ctx.Manager()
+        if path is not None:
+            self._server = await asyncio.start_unix_server(
+                self._connection, path)
+        else:
+            self._server = await asyncio.start_server(
+                self._connection, host, port)
+        return self._server
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+        # запросы отменяются раньше, чем останавливается менеджер,
+        # через который отмена передаётся процессам
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._server is not None:
+            await self._server.wait_closed()
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+        if self._manager is not None:
+            self._manager.shutdown()
+
+    def metrics(self):
+        lat = sorted(self._latencies)
+
+        def percentile(p):
+            if not lat:
+                return None
+            k = max(0, -(-len(lat) * p // 100) - 1)
+            return round(lat[int(k)] * 1000, 3)
+
+        return {
+            'status': 'ok',
+            'workers': self.workers,
+            'queue': self.waiting,
+            'running': self.running,
+            'requests': self.requests,
+            'errors': self.errors,
+            'latency_ms': {'p50': percentile(50), 'p90': percentile(90),
+                           'p99': percentile(99)},
+        }
+
+    async def _connection(self, reader, writer):
+        lock = asyncio.Lock()
+        tasks = set()
+        self._tasks.add(asyncio.current_task())
+
+        async def send(req_id, msg):
+            msg['id'] = req_id
+            async with lock:
+                writer.write(json.dumps(msg).encode() + b'\n')
+                await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                task = asyncio.ensure_future(self._request(line, send))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.wait(tasks)
+        except (ConnectionError, asyncio.IncompleteReadError,
+                asyncio.CancelledError):
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+            self._tasks.discard(asyncio.current_task())
+
+    async def _request(self, line, send):
+        req_id = None
+        try:
+            req = json.loads(line)
+            if not isinstance(req, dict):
+                raise ValueError('request should be an object')
+            req_id = req.get('id')
+            op = req.get('op')
+            if op == 'health':
+                await send(req_id, self.metrics())
+                return
+            if op not in ('solve', 'generate'):
+                raise ValueError('unknown op: {}'.format(op))
+            num = req.get('num', 1)
+            if op == 'solve' and (type(num) is not int or
+                                  num < 1 and num != -1):
+                raise ValueError('num should be a positive integer or -1')
+            timeout = req.get('timeout')
+            if timeout is not None and (
+                    type(timeout) not in (int, float) or timeout <= 0):
+                raise ValueError('timeout should be a positive number')
+        except ValueError as e:
+            self.errors += 1
+            await send(req_id, {'error': str(e)})
+            return
+
+        self.requests += 1
+        if self.waiting >= self.max_queue:
+            self.errors += 1
+            await send(req_id, {'error': 'busy'})
+            return
+        start = time.monotonic()
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        try:
+            if op == 'solve':
+                ok = await self._solve(req, req_id, send)
+            else:
+                ok = await self._generate(req, req_id, send)
+            if not ok:
+                self.errors += 1
+        except ConnectionError:
+            # клиент отключился, перебор уже отменён
+            pass
+        finally:
+            self.running -= 1
+            self._slots.release()
+            self._latencies.append(time.monotonic() - start)
+
+    def _timeout(self, req):
+        # время на запрос: из запроса, но не больше self.timeout
+        timeout = req.get('timeout', self.timeout)
+        if self.timeout is not None:
+            timeout = min(timeout or self.timeout, self.timeout)
+        return timeout
+
+    async def _generate(self, req, req_id, send):
+        loop = asyncio.get_running_loop()
+        try:
+            res = await loop.run_in_executor(self._pool, _generate, req,
+                                             self._timeout(req))
+        except Exception as e:
+            # процесс пула упал
+            res = {'error': _describe(e)}
+        await send(req_id, res)
+        return 'error' not in res
+
+    async def _solve(self, req, req_id, send):
+        loop = asyncio.get_running_loop()
+        results = self._manager.Queue(STREAM_BUFFER)
+        cancel = self._manager.Event()
+        job = loop.run_in_executor(self._pool, _solve, req,
+                                   self._timeout(req), results, cancel)
+        try:
+            while True:
+                # очередь читается с таймаутом, чтобы заметить процесс,
+                # который завершился, не положив последнего сообщения
+                try:
+                    msg = await loop.run_in_executor(
+                        None, results.get, True, POLL_INTERVAL)
+                except queue.Empty:
+                    if not job.done():
+                        continue
+                    # всё, что процесс успел положить, уже прочитано
+                    error = job.exception()
+                    msg = {'error': _describe(error) if error else
+                           'solver stopped without a result'}
+                await send(req_id, msg)
+                if 'solution' not in msg:
+                    if not job.done():
+                        await job
+                    return 'error' not in msg
+        except BaseException:
+            # клиент отключился или сервер останавливается
+            cancel.set()
+            raise
+
+
+def _put(results, cancel, msg):
+    # кладёт сообщение в очередь; если клиент не читает и запрос
+    # отменён - False
+    while True:
+        try:
+            results.put(msg, timeout=0.2)
+            return True
+        except queue.Full:
+            if cancel.is_set():
+                return False
+
+
+def _watch(cancel, token, done):
+    # переносит отмену из другого процесса в CancelToken, который
+    # перебор проверяет на каждом узле без обращений к менеджеру
+    while not done.is_set():
+        if cancel.wait(0.1):
+            token.cancel()
+            return
+
+
+def _solve(req, timeout, results, cancel):
+    token = CancelToken()
+    done = threading.Event()
+    watcher = threading.Thread(target=_watch, args=(cancel, token, done),
+                               daemon=True)
+    watcher.start()
+    try:
+        inp = req.get('sudoku')
+        if isinstance(inp, list):
+            inp = '\n'.join(' '.join(map(str, row)) for row in inp)
+        sudoku = Sudoku(inp, bool(req.get('first')), bool(req.get('second')))
+        num = req.get('num', 1)
+        num = None if num == -1 else num
+        budget = Budget(timeout, token=token)
+        count = 0
+        for sol in islice(sudoku.solve(budget=budget), num):
+            if not _put(results, cancel, {'solution': sol.to_lists()}):
+                return
+            count += 1
+        stopped = budget.result.reason if budget.exhausted else None
+        _put(results, cancel, {'done': True, 'count': count,
+                               'stopped': stopped})
+    except Exception as e:
+        # на любую ошибку клиент получает ответ, а сервер - конец перебора
+        _put(results, cancel, {'error': _describe(e)})
+    finally:
+        done.set()
+
+
+def _describe(e):
+    if isinstance(e, ex.SudokuException):
+        return str(e)
+    return '{}: {}'.format(type(e).__name__, e)
+
+
+def _generate(req, timeout=None):
+    try:
+        colors = req.get('colors')
+        if colors is not None:
+            colors = str_to_tuples(colors)
+            if colors is None:
+                return {'error': 'Wrong colors. Example: 1,2,3_45,69_56'}
+        gen = SudokuGen(req.get('size', 3), req.get('percent', 30),
+                        bool(req.get('first')), colors,
+                        bool(req.get('unique')), budget=Budget(timeout))
+    except Exception as e:
+        return {'error': _describe(e)}
+    return {'sudoku': gen.table.to_lists(),
+            'solution': gen.ref_table.to_lists(),
+            'colors': gen.second_colors}
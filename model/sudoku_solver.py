@@ -1,30 +1,43 @@
-import math
 import os
-from copy import deepcopy
-from itertools import chain
+from itertools import chain, islice
 from collections import Counter
 import model.sudoku_exceptions as ex
+from model.sudoku_canon import canonical_form
+from model.sudoku_conditions import FirstCondPropagator, \
+    SecondCondPropagator
+import model.sudoku_engines as engines
 from model.sudoku_gen import SudokuGen
+from model.sudoku_parser import Puzzle, parse_puzzle
 from model.sudoku_solver_bf import SudokuBF
-from model.utils import str_to_tuples
+from model.sudoku_solver_simple import SudokuSimple
+from model.sudoku_stats import phase
 
 
 class Sudoku:
-    def __init__(self, inp, first_cond=False, second_cond=False):
-        if isinstance(inp, SudokuGen):
-            self._side, self._order, self._field, self.second_colors = \
-                inp.side, inp.order, deepcopy(inp.table), inp.second_colors
-        elif isinstance(inp, str):
-            read_lines = list(filter(None, inp.split('\n')))
-            self._side, self._order, self._field, self.second_colors = \
-                self._parse(read_lines)
-        elif isinstance(inp, list):
-            self._side, self._order, self._field, self.second_colors = \
-                self._parse(inp)
-        else:
-            raise ex.SudokuWrongInputError('Input cannot be parsed')
-
-        self._check_validity()
+    def __init__(self, inp, first_cond=False, second_cond=False,
+                 stats=None):
+        # stats - SolveStats, в который пишется время этапов и счётчики
+        # перебора (None - статистика не собирается)
+        self.stats = stats
+        with phase(stats, 'parse'):
+            if isinstance(inp, SudokuGen):
+                self._side, self._order, self._field, self.second_colors = \
+                    inp.side, inp.order, inp.table.copy(), \
+                    inp.second_colors
+            else:
+                # строка, список строк или файл; Puzzle - уже разобранная
+                # судоку (см. sudoku_parser.iter_puzzles)
+                if isinstance(inp, str):
+                    inp = parse_puzzle(inp.encode())
+                elif isinstance(inp, list) or hasattr(inp, 'read'):
+                    inp = parse_puzzle(inp)
+                elif not isinstance(inp, Puzzle):
+                    raise ex.SudokuWrongInputError('Input cannot be parsed')
+                self._side, self._order, self._field, self.second_colors = \
+                    inp.order ** 2, inp.order, inp.field, inp.colors
+
+        with phase(stats, 'validity'):
+            self._check_validity()
 
         self.first_cond = first_cond
         if first_cond and self._order % 2 == 0:
@@ -48,91 +61,19 @@ class Sudoku:
                         'are out of range')
             self.second_cond = len(self.second_colors) > 1
 
+    @property
+    def field(self):
+        # задача (Grid); менять её нельзя
+        return self._field
+
     @classmethod
     def get_from_file(cls, file_path, first_cond=False):
-        with open(os.path.abspath(file_path), 'rt') as f:
-            s = Sudoku(f.read(), first_cond)
-        return s
+        return Sudoku(parse_puzzle(os.path.abspath(file_path)), first_cond)
 
-    @staticmethod
-    def _parse(read_lines):
-        field = []
-        length = 0
-        order = 0
-        values = 0
-        second_colors = None
-        for i, l in enumerate(read_lines):
-            line = l.strip()
-            if line.startswith('#'):
-                st = str_to_tuples(
-                    line.strip('#').strip())
-                if st:
-                    second_colors = st
-                continue
-
-            splitline = line.split()
-            if length == 0:
-                length = len(splitline)
-                order = int(math.sqrt(length))
-                if length != order ** 2:
-                    raise ex.SudokuWrongInputError(
-                        "The input Sudoku has unusual row length "
-                        "(expected {0}, got {1})".format(
-                            order ** 2, length))
-                values = tuple(range((order ** 2) + 1))
-            elif length != len(splitline):
-                raise ex.SudokuWrongInputError(
-                    "The input Sudoku is not valid (line {0})".format(i))
-
-            row = []
-            for j, value in enumerate(splitline):
-                if value.isdigit() and int(value):
-                    if int(value) not in values:
-                        raise ex.SudokuWrongInputError(
-                            "The input Sudoku is not valid (line {0}, "
-                            "value {1} should be not bigger than {2}".format(
-                                i, value, length))
-                    row.append(int(value))
-                else:
-                    row.append(0)
-            field.append(row)
-        if len(field) == 1:
-            raise ex.SudokuWrongInputError(
-                "The input Sudoku is not valid (too small)")
-        if len(field) != length:
-            raise ex.SudokuWrongInputError(
-                "The input Sudoku has unusual size "
-                "(expected {0}x{0} or {1}x{1})".format(
-                    length, len(field)))
-        return length, order, field, second_colors
-
-    def _col(self, n):
-        return [r[n] for r in self._iter_row()]
-
-    def _row(self, n):
-        return self._field[n]
-
-    def _iter_col(self):
-        for k in range(self._side):
-            yield self._col(k)
-
-    def _iter_row(self):
-        for k in range(self._side):
-            yield self._row(k)
-
-    def _house(self, row, col):
-        house = []
-        house_i = (row // self._order) * self._order
-        house_j = (col // self._order) * self._order
-        for i in range(house_i, house_i + self._order):
-            for j in range(house_j, house_j + self._order):
-                house.append(self._field[i][j])
-        return house
-
-    def _house_iter(self):
-        for i in range(self._order):
-            for j in range(self._order):
-                yield self._house(i * self._order, j * self._order)
+    def canonical(self):
+        # (таблица, хэш, преобразование), см. canonical_form;
+        # цвета второго условия при этом не учитываются
+        return canonical_form(self._field, self._order)
 
     @staticmethod
     def _check_no_dups(values):
@@ -146,9 +87,9 @@ class Sudoku:
     def _check_validity(self):
         if not all(map(Sudoku._check_no_dups,
                        chain(
-                           self._iter_row(),
-                           self._iter_col(),
-                           self._house_iter()))):
+                           self._field.rows(),
+                           self._field.cols(),
+                           self._field.houses()))):
             raise ex.SudokuWrongInputError(
                 'Sudoku is not valid '
                 '(there are equal values in rows/cols/houses)')
@@ -180,12 +121,69 @@ class Sudoku:
     def _get_cell(num, field, side):
         return field[num // side][num % side]
 
-    def solve(self):
-        solutions = SudokuBF(self._side, self._order, self._field).solve()
-        for solution in solutions:
-            if (not self.first_cond
-                or self._check_first_cond(self._side, solution)) \
-                    and (not self.second_cond
-                         or self._check_second_cond(
-                             solution, self.second_colors)):
-                yield solution
+    def _propagators(self):
+        props = []
+        if self.first_cond:
+            props.append(FirstCondPropagator(self._side))
+        if self.second_cond:
+            props.append(
+                SecondCondPropagator(self._side, self.second_colors))
+        return props
+
+    def _solver(self, solver, options, field=None):
+        # доп. условия проверяются во время перебора, а не после него;
+        # solver - класс движка или его имя (см. sudoku_engines)
+        if isinstance(solver, str):
+            solver = engines.get(solver, self)
+        if self.stats is not None:
+            options = dict(options, stats=self.stats)
+        if field is None:
+            field = self._field
+        return solver(self._side, self._order, field,
+                      propagators=self._propagators(), **options)
+
+    def _presolve(self):
+        # Заполняет клетки, которые следуют из правил без перебора
+        # (SudokuSimple); None - если правила нарушаются
+        try:
+            with phase(self.stats, 'presolve'):
+                return SudokuSimple(self._side, self._order,
+                                    self._field).propagate()
+        except ex.SudokuNoSolutionError:
+            return None
+
+    def solve(self, solver=SudokuBF, materialize=True, presolve=False,
+              **options):
+        if presolve:
+            return self._solve_presolved(solver, materialize, options)
+        return self._solver(solver, options).solve(materialize)
+
+    def _solve_presolved(self, solver, materialize, options):
+        field = self._presolve()
+        if field is None:
+            return
+        givens = self._field
+        filled = tuple((r, c, n) for r, c, n in field.filled()
+                       if not givens[r, c])
+        if not self.first_cond and not self.second_cond and \
+                not field.count(0):
+            # судоку решена без перебора; бюджет учитывает решение, даже
+            # если после него генератор закрывают (как islice в -n 1)
+            budget = options.get('budget')
+            if budget is None:
+                yield field if materialize else filled
+                return
+            budget.start(self.stats)
+            try:
+                yield field if materialize else filled
+            finally:
+                budget.solution(0)
+            return
+        for sol in self._solver(solver, options, field).solve(materialize):
+            yield sol if materialize else filled + sol
+
+    def count(self, limit=None, solver=SudokuBF, presolve=False, **options):
+        if presolve:
+            return sum(1 for _ in islice(
+                self.solve(solver, False, True, **options), limit))
+        return self._solver(solver, options).count(limit)
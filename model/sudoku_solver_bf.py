@@ -1,85 +1,384 @@
-from copy import deepcopy
-from itertools import product
+from collections import OrderedDict
+from itertools import islice, product
+from random import randrange
+from types import MappingProxyType
+import model.sudoku_exceptions as ex
+from model.sudoku_grid import Grid
+
+TIE_BREAKS = ('first', 'last', 'random')
+# ограничение кэша шаблонов в элементах матрицы (4 * side**3 на порядок):
+# порядки 2-5 помещаются вместе, а шаблон большего порядка держится один
+# и вытесняется следующим же шаблоном
+TEMPLATE_CACHE_LIMIT = 100000
+_templates = OrderedDict()
 
 
 class SudokuBF:
-    def __init__(self, side, order, field):
+    def __init__(self, side, order, field, tie_break='first', iterative=True,
+                 propagators=(), excluded=(), stats=None, budget=None,
+                 checkpoint=None, resume=None):
+        if tie_break not in TIE_BREAKS:
+            raise ValueError(
+                'Unknown tie-break policy: {}'.format(tie_break))
+        if resume is not None and not iterative:
+            raise ValueError('Only the iterative search can be resumed')
         self._side, self._order, self._field = \
-            side, order, field
+            side, order, Grid.of(field, order)
+        self._tie_break = tie_break
+        self._iterative = iterative
+        self._props = tuple(propagators)
+        # кандидаты (r, c, n), которые заранее убираются из перебора
+        self._excluded = excluded
+        # число испробованных кандидатов (узлов дерева перебора)
+        self.nodes = 0
+        # узлы, перебранные до resume
+        self._nodes_before = 0
+        # SolveStats или None
+        self.stats = stats
+        # Budget или None
+        self.budget = budget
+        # стек и выбранные кандидаты итеративного перебора
+        self._stack = []
+        self._solution = []
+        # сколько решений отдано (с учётом перебора до resume) и
+        # закончен ли перебор
+        self.found = 0
+        self._done = False
+        # Checkpoint или None; позиция (state()), с которой
+        # продолжается перебор
+        self.checkpoint = checkpoint
+        self._resume = resume
 
         self.X = {}
         self.Y = {}
+        # столбцы, разложенные по текущему размеру:
+        # self._buckets[k] - упорядоченное множество столбцов с k строками
+        self._buckets = []
 
-    def solve(self):
-        self._set_dicts()
+    def solve(self, materialize=True):
+        # materialize=False - вместо копии поля отдаются только
+        # кортежи (r, c, n) заполненных при переборе клеток
+        stats = self.stats
+        if stats is None:
+            ok = self._set_dicts()
+        else:
+            with stats.phase('setup'):
+                ok = self._set_dicts()
+        if not ok:
+            return
 
-        for i, row in enumerate(self._field):
-            for j, n in enumerate(row):
-                if n:
-                    self._select((i, j, n))
+        if self.budget is not None:
+            self.budget.start(stats)
+        if self.checkpoint is not None:
+            self.checkpoint.start(self)
+        search = self._solve_iter() if self._iterative else self._solve([])
+        if stats is not None:
+            search = stats.timed('search', search)
+        if not materialize:
+            yield from search
+            return
+        for solution in search:
+            yield self._field.copy().update(solution)
 
-        for solution in self._solve():
-            field = deepcopy(self._field)
-            for (r, c, n) in solution:
-                field[r][c] = n
-            yield field
+    def count(self, limit=None):
+        return sum(1 for _ in islice(self.solve(False), limit))
 
     def _set_dicts(self):
-        temp = ([("rc", rc) for rc in product(range(self._side), repeat=2)] +
-                [("rn", rn) for rn in product(range(self._side),
-                                              range(1, self._side + 1))] +
-                [("cn", cn) for cn in product(range(self._side),
-                                              range(1, self._side + 1))] +
-                [("hn", bn) for bn in product(range(self._side),
-                                              range(1, self._side + 1))])
-
-        for row, column, num in product(range(self._side),
-                                        range(self._side),
-                                        range(1, self._side + 1)):
-            house = (row // self._order) * \
-                self._order + (column // self._order)
-            self.Y[(row, column, num)] = [
-                ("rc", (row, column)),
-                ("rn", (row, num)),
-                ("cn", (column, num)),
-                ("hn", (house, num))]
-
-        self.X = {_: set() for _ in temp}
-        for value_guess, corresponding_pos in self.Y.items():
-            for pos in corresponding_pos:
-                self.X[pos].add(value_guess)
-
-    def _solve(self, solution=list()):
+        # матрица берётся из общего для порядка шаблона, заново
+        # строятся только столбцы, не покрытые заданными клетками
+        X, self.Y = _template(self._order)
+        givens = self._field.filled()
+        covered = set()
+        removed = set(self._excluded)
+        for r in givens:
+            if not self._assign(r):
+                return False
+            for col in self.Y[r]:
+                if col in covered:
+                    return False
+                covered.add(col)
+                removed.update(X[col])
+
+        self.X = {}
+        self._buckets = [{} for _ in range(self._side + 1)]
+        for col, rows in X.items():
+            if col not in covered:
+                self.X[col] = rows = set(rows)
+                rows.difference_update(removed)
+                self._buckets[len(rows)][col] = None
+        return True
+
+    def _min_column(self):
+        for bucket in self._buckets:
+            if bucket:
+                if self._tie_break == 'first':
+                    return next(iter(bucket))
+                if self._tie_break == 'last':
+                    return next(reversed(bucket))
+                return next(islice(bucket, randrange(len(bucket)), None))
+
+    def _assign(self, r):
+        # ограничения обновляются все, даже если одно уже нарушено,
+        # чтобы _unassign мог откатить их одинаково
+        ok = True
+        for prop in self._props:
+            ok = prop.assign(*r) and ok
+        return ok
+
+    def _unassign(self, r):
+        for prop in self._props:
+            prop.unassign(*r)
+
+    def _solve(self, solution):
+        stats, budget = self.stats, self.budget
         if not self.X:
-            yield list(solution)
+            if stats is not None:
+                stats.solutions += 1
+            yield tuple(solution)
+            if budget is not None:
+                budget.solution(self.nodes)
         else:
-            c = min(self.X, key=lambda x: len(self.X[x]))
-            for r in list(self.X[c]):
+            c = self._min_column()
+            rows = list(self.X[c])
+            if stats is not None:
+                stats.branch(len(solution), len(rows))
+            for r in rows:
+                if budget is not None and budget.check(self.nodes):
+                    return
+                self.nodes += 1
+                if stats is not None:
+                    stats.nodes += 1
                 solution.append(r)
                 cols = self._select(r)
-                for s in self._solve(solution):
-                    yield s
+                if not self._props or self._assign(r):
+                    for s in self._solve(solution):
+                        yield s
+                elif stats is not None:
+                    stats.discarded += 1
+                if self._props:
+                    self._unassign(r)
                 self._deselect(r, cols)
                 solution.pop()
 
+    def _solve_iter(self):
+        # тот же перебор, что и в _solve, но без рекурсии: в стеке хранятся
+        # [столбец, кандидаты, индекс следующего кандидата, удалённые столбцы]
+        stats, budget, checkpoint = self.stats, self.budget, self.checkpoint
+        props = self._props
+        if self._resume is not None and self._restore(self._resume):
+            if self._done:
+                return
+        elif not self.X:
+            # единственное решение отдаётся сразу, дальше перебирать нечего
+            self.found += 1
+            self._done = True
+            if stats is not None:
+                stats.solutions += 1
+            yield ()
+            if budget is not None:
+                budget.solution(self.nodes)
+            return
+        else:
+            c = self._min_column()
+            self._solution = []
+            self._stack = [[c, list(self.X[c]), 0, None]]
+            if stats is not None:
+                stats.branch(0, len(self._stack[0][1]))
+        stack, solution = self._stack, self._solution
+        while stack:
+            frame = stack[-1]
+            if frame[3] is not None:
+                r = solution.pop()
+                if props:
+                    self._unassign(r)
+                self._deselect(r, frame[3])
+                frame[3] = None
+            c, rows, i, _ = frame
+            if i == len(rows):
+                stack.pop()
+                continue
+            r = rows[i]
+            # здесь позиция перебора - та же, что после остановки бюджетом
+            if checkpoint is not None and checkpoint.due(self.nodes):
+                checkpoint.save()
+            if budget is not None and budget.check(self.nodes):
+                return
+            self.nodes += 1
+            if stats is not None:
+                stats.nodes += 1
+            frame[2] = i + 1
+            frame[3] = self._select(r)
+            solution.append(r)
+            if props and not self._assign(r):
+                if stats is not None:
+                    stats.discarded += 1
+                continue
+            if not self.X:
+                self.found += 1
+                if stats is not None:
+                    stats.solutions += 1
+                yield tuple(solution)
+                if budget is not None and budget.solution(self.nodes):
+                    return
+            else:
+                c = self._min_column()
+                stack.append([c, list(self.X[c]), 0, None])
+                if stats is not None:
+                    stats.branch(len(solution), len(stack[-1][1]))
+        self._done = True
+
+    def state(self):
+        # Позиция итеративного перебора (словарь для JSON): на каждом
+        # уровне стека - кандидаты, индекс следующего кандидата и выбран
+        # ли сейчас предыдущий (тогда он лежит в решении). Снимать её
+        # можно, пока перебор стоит на отданном решении, после остановки
+        # бюджетом или из Checkpoint; SudokuBF(..., resume=state)
+        # продолжает перебор с этого места
+        return {
+            'order': self._order,
+            'field': self._field.to_lists(),
+            'tie_break': self._tie_break,
+            'nodes': self._nodes_before + self.nodes,
+            'solutions': self.found,
+            'done': self._done,
+            'stack': [[[list(r) for r in rows], i, cols is not None]
+                      for _, rows, i, cols in self._stack],
+        }
+
+    def _restore(self, state):
+        # восстанавливает стек и выбранных кандидатов из state();
+        # False - сохранённый перебор ещё не начинался
+        if state.get('order') != self._order or \
+                state.get('field') != self._field.to_lists():
+            raise ex.SudokuCheckpointError(
+                'The saved search is for another Sudoku')
+        try:
+            self.found = int(state['solutions'])
+            self._nodes_before = int(state['nodes'])
+            done = bool(state['done'])
+        except (KeyError, TypeError, ValueError):
+            raise ex.SudokuCheckpointError(
+                'The saved search position is not valid')
+        if done:
+            self._done = True
+            return True
+        if not state['stack']:
+            return False
+        self._stack, self._solution = stack, solution = [], []
+        try:
+            for rows, i, selected in state['stack']:
+                rows = [tuple(r) for r in rows]
+                frame = [None, rows, i, None]
+                if selected:
+                    r = rows[i - 1]
+                    frame[3] = self._select(r)
+                    solution.append(r)
+                    if self._props:
+                        self._assign(r)
+                stack.append(frame)
+        except (KeyError, TypeError, ValueError, IndexError):
+            raise ex.SudokuCheckpointError(
+                'The saved search position is not valid')
+        return True
+
+    def frontier(self):
+        # Непройденная часть перебора, остановленного бюджетом: на каждом
+        # уровне стека - ещё не испробованные кандидаты. Для каждого
+        # возвращается (путь, кандидаты): путь - номера кандидатов по
+        # уровням (в порядке перебора), кандидаты - выбранные на нижних
+        # уровнях (r, c, n) и сам этот кандидат
+        tasks = []
+        path = ()
+        for k, (_, rows, i, cols) in enumerate(self._stack):
+            prefix = tuple(self._solution[:k])
+            for j in range(i, len(rows)):
+                tasks.append((path + (j,), prefix + (rows[j],)))
+            if cols is not None:
+                path += (i - 1,)
+        return tasks
+
     def _select(self, r):
+        X, Y, buckets = self.X, self.Y, self._buckets
         cols = []
-        for j in self.Y[r]:
+        for j in Y[r]:
             # удаляем из X все записи о соответствующей ячейке,
             # так как она считается заполненой
-            for i in self.X[j]:
-                for k in self.Y[i]:
+            for i in X[j]:
+                for k in Y[i]:
                     if k != j:
-                        self.X[k].remove(i)
-            cols.append(self.X.pop(j))
+                        col = X[k]
+                        del buckets[len(col)][k]
+                        col.remove(i)
+                        buckets[len(col)][k] = None
+            col = X.pop(j)
+            del buckets[len(col)][j]
+            cols.append(col)
         return cols
 
     def _deselect(self, r, cols):
         # возвращаем в Х записи о соответствующей ячейке,
         # так как считаем, что выбор неправильный
-        for j in reversed(self.Y[r]):
-            self.X[j] = cols.pop()
-            for i in self.X[j]:
-                for k in self.Y[i]:
+        X, Y, buckets = self.X, self.Y, self._buckets
+        for j in reversed(Y[r]):
+            X[j] = cols.pop()
+            buckets[len(X[j])][j] = None
+            for i in X[j]:
+                for k in Y[i]:
                     if k != j:
-                        self.X[k].add(i)
+                        col = X[k]
+                        del buckets[len(col)][k]
+                        col.add(i)
+                        buckets[len(col)][k] = None
+
+
+def _template_size(order):
+    return 4 * order ** 6
+
+
+def _template(order):
+    # пустая матрица точного покрытия зависит только от порядка судоку,
+    # поэтому она строится один раз и дальше только копируется
+    if order in _templates:
+        _templates.move_to_end(order)
+        return _templates[order]
+
+    template = _build_template(order)
+    _templates[order] = template
+    size = sum(map(_template_size, _templates))
+    while size > TEMPLATE_CACHE_LIMIT and len(_templates) > 1:
+        evicted, _ = _templates.popitem(last=False)
+        size -= _template_size(evicted)
+    return template
+
+
+def _build_template(order):
+    side = order ** 2
+    temp = ([("rc", rc) for rc in product(range(side), repeat=2)] +
+            [("rn", rn) for rn in product(range(side),
+                                          range(1, side + 1))] +
+            [("cn", cn) for cn in product(range(side),
+                                          range(1, side + 1))] +
+            [("hn", bn) for bn in product(range(side),
+                                          range(1, side + 1))])
+
+    Y = {}
+    for row, column, num in product(range(side),
+                                    range(side),
+                                    range(1, side + 1)):
+        house = (row // order) * order + (column // order)
+        Y[(row, column, num)] = (
+            ("rc", (row, column)),
+            ("rn", (row, num)),
+            ("cn", (column, num)),
+            ("hn", (house, num)))
+
+    X = {_: set() for _ in temp}
+    for value_guess, corresponding_pos in Y.items():
+        for pos in corresponding_pos:
+            X[pos].add(value_guess)
+    return MappingProxyType({k: frozenset(v) for k, v in X.items()}), \
+        MappingProxyType(Y)
+
+
+def clear_template_cache():
+    _templates.clear()
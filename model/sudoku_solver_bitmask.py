@@ -0,0 +1,170 @@
+from itertools import islice
+from model.sudoku_grid import Grid
+
+try:
+    _popcount = int.bit_count
+except AttributeError:
+    def _popcount(mask):
+        return bin(mask).count('1')
+
+
+class SudokuBitmask:
+    # Перебор по клеткам, как в model/ttt.py, но для любого порядка: для
+    # каждой строки, столбца и квадрата хранится маска занятых чисел
+    # (бит n - 1 для числа n), поэтому кандидаты клетки - одна операция
+    # над тремя масками, а не просмотр её строки, столбца и квадрата.
+    # Следующей берётся пустая клетка с наименьшим числом кандидатов.
+    # Матрица точного покрытия не строится, поэтому подготовка почти
+    # ничего не стоит - это лучший выбор для быстрых одиночных решений
+    def __init__(self, side, order, field, propagators=(), stats=None,
+                 budget=None):
+        self._side, self._order, self._field = \
+            side, order, Grid.of(field, order)
+        self._props = tuple(propagators)
+        # число испробованных кандидатов (узлов дерева перебора)
+        self.nodes = 0
+        # SolveStats или None
+        self.stats = stats
+        # Budget или None
+        self.budget = budget
+
+        self._rows = []
+        self._cols = []
+        self._houses = []
+        # пустые клетки (r, c, квадрат); во время перебора первые depth
+        # из них заполнены
+        self._cells = []
+
+    def solve(self, materialize=True):
+        stats = self.stats
+        if stats is None:
+            ok = self._set_masks()
+        else:
+            with stats.phase('setup'):
+                ok = self._set_masks()
+        if not ok:
+            return
+
+        if self.budget is not None:
+            self.budget.start(stats)
+        search = self._solve()
+        if stats is not None:
+            search = stats.timed('search', search)
+        if not materialize:
+            yield from search
+            return
+        for solution in search:
+            yield self._field.copy().update(solution)
+
+    def count(self, limit=None):
+        return sum(1 for _ in islice(self.solve(False), limit))
+
+    def _set_masks(self):
+        side, order = self._side, self._order
+        rows, cols, houses = [0] * side, [0] * side, [0] * side
+        cells = []
+        for i, n in enumerate(self._field.flat):
+            r, c = divmod(i, side)
+            h = (r // order) * order + c // order
+            if not n:
+                cells.append((r, c, h))
+                continue
+            bit = 1 << (n - 1)
+            if (rows[r] | cols[c] | houses[h]) & bit:
+                return False
+            rows[r] |= bit
+            cols[c] |= bit
+            houses[h] |= bit
+            ok = True
+            for prop in self._props:
+                ok = prop.assign(r, c, n) and ok
+            if not ok:
+                return False
+        self._rows, self._cols, self._houses, self._cells = \
+            rows, cols, houses, cells
+        return True
+
+    def _pick(self, depth):
+        # ставит на место depth пустую клетку с наименьшим числом
+        # кандидатов и возвращает маску её кандидатов
+        rows, cols, houses, cells = \
+            self._rows, self._cols, self._houses, self._cells
+        full = (1 << self._side) - 1
+        best = depth
+        best_mask = 0
+        best_count = self._side + 1
+        for k in range(depth, len(cells)):
+            r, c, h = cells[k]
+            mask = full & ~(rows[r] | cols[c] | houses[h])
+            count = _popcount(mask)
+            if count < best_count:
+                best, best_mask, best_count = k, mask, count
+                if count <= 1:
+                    break
+        cells[depth], cells[best] = cells[best], cells[depth]
+        if self.stats is not None:
+            self.stats.branch(depth, best_count)
+        return best_mask
+
+    def _solve(self):
+        rows, cols, houses, cells = \
+            self._rows, self._cols, self._houses, self._cells
+        props, stats, budget = self._props, self.stats, self.budget
+        n = len(cells)
+        if not n:
+            if stats is not None:
+                stats.solutions += 1
+            yield ()
+            if budget is not None:
+                budget.solution(self.nodes)
+            return
+        # на каждом уровне - ещё не испробованные кандидаты и
+        # поставленное сейчас число (бит, 0 - ничего)
+        masks = [0] * n
+        values = [0] * n
+        masks[0] = self._pick(0)
+        depth = 0
+        while depth >= 0:
+            r, c, h = cells[depth]
+            bit = values[depth]
+            if bit:
+                rows[r] ^= bit
+                cols[c] ^= bit
+                houses[h] ^= bit
+                values[depth] = 0
+                if props:
+                    for prop in props:
+                        prop.unassign(r, c, bit.bit_length())
+            mask = masks[depth]
+            if not mask:
+                depth -= 1
+                continue
+            if budget is not None and budget.check(self.nodes):
+                return
+            self.nodes += 1
+            if stats is not None:
+                stats.nodes += 1
+            bit = mask & -mask
+            masks[depth] = mask ^ bit
+            values[depth] = bit
+            rows[r] |= bit
+            cols[c] |= bit
+            houses[h] |= bit
+            if props:
+                ok = True
+                for prop in props:
+                    ok = prop.assign(r, c, bit.bit_length()) and ok
+                if not ok:
+                    if stats is not None:
+                        stats.discarded += 1
+                    continue
+            if depth + 1 == n:
+                if stats is not None:
+                    stats.solutions += 1
+                yield tuple((rc[0], rc[1], v.bit_length())
+                            for rc, v in zip(cells, values))
+                if budget is not None and budget.solution(self.nodes):
+                    return
+                continue
+            depth += 1
+            masks[depth] = self._pick(depth)
@@ -0,0 +1,242 @@
+from itertools import islice
+from model.sudoku_grid import Grid
+
+
+class SudokuDLX:
+    # Алгоритм X на "танцующих ссылках" (Knuth): матрица точного покрытия
+    # хранится в плоских списках целых чисел, узел 0 - корень,
+    # узлы 1..cols - заголовки столбцов, дальше - узлы строк
+    def __init__(self, side, order, field, propagators=(), stats=None,
+                 budget=None):
+        self._side, self._order, self._field = \
+            side, order, Grid.of(field, order)
+        self._props = tuple(propagators)
+        # число испробованных кандидатов (узлов дерева перебора)
+        self.nodes = 0
+        # SolveStats или None
+        self.stats = stats
+        # Budget или None
+        self.budget = budget
+
+        self.L = []
+        self.R = []
+        self.U = []
+        self.D = []
+        self.C = []
+        self.S = []
+        self.ROW = []
+
+    def solve(self, materialize=True):
+        stats = self.stats
+        if stats is None:
+            ok = self._set_links()
+        else:
+            with stats.phase('setup'):
+                ok = self._set_links()
+        if not ok:
+            return
+
+        if self.budget is not None:
+            self.budget.start(stats)
+        search = self._solve()
+        if stats is not None:
+            search = stats.timed('search', search)
+        if not materialize:
+            yield from search
+            return
+        for solution in search:
+            yield self._field.copy().update(solution)
+
+    def count(self, limit=None):
+        return sum(1 for _ in islice(self.solve(False), limit))
+
+    def _cell(self, row_id):
+        rc, n = divmod(row_id, self._side)
+        r, c = divmod(rc, self._side)
+        return r, c, n + 1
+
+    def _assign(self, row_id):
+        ok = True
+        cell = self._cell(row_id)
+        for prop in self._props:
+            ok = prop.assign(*cell) and ok
+        return ok
+
+    def _unassign(self, row_id):
+        cell = self._cell(row_id)
+        for prop in self._props:
+            prop.unassign(*cell)
+
+    def _set_links(self):
+        side, order = self._side, self._order
+        cells = side * side
+        cols = 4 * cells
+
+        L = list(range(-1, cols))
+        L[0] = cols
+        R = list(range(1, cols + 2))
+        R[cols] = 0
+        U = list(range(cols + 1))
+        D = list(range(cols + 1))
+        C = list(range(cols + 1))
+        S = [0] * (cols + 1)
+        ROW = [-1] * (cols + 1)
+        # первая строка-узел для каждого кандидата (r, c, n)
+        self._first = first = [0] * (cells * side)
+
+        node = cols + 1
+        for r in range(side):
+            for c in range(side):
+                h = (r // order) * order + c // order
+                for n in range(side):
+                    row_id = (r * side + c) * side + n
+                    first[row_id] = base = node
+                    headers = (1 + r * side + c,
+                               1 + cells + r * side + n,
+                               1 + 2 * cells + c * side + n,
+                               1 + 3 * cells + h * side + n)
+                    for k, col in enumerate(headers):
+                        L.append(base + (k - 1) % 4)
+                        R.append(base + (k + 1) % 4)
+                        U.append(U[col])
+                        D.append(col)
+                        D[U[col]] = node
+                        U[col] = node
+                        C.append(col)
+                        ROW.append(row_id)
+                        S[col] += 1
+                        node += 1
+
+        self.L, self.R, self.U, self.D, self.C, self.S, self.ROW = \
+            L, R, U, D, C, S, ROW
+
+        covered = [False] * (cols + 1)
+        for i, n in enumerate(self._field.flat):
+            if n:
+                row_id = i * side + n - 1
+                if not self._assign(row_id):
+                    return False
+                row_node = first[row_id]
+                k = row_node
+                while True:
+                    col = C[k]
+                    if covered[col]:
+                        return False
+                    covered[col] = True
+                    self._cover(col)
+                    k = R[k]
+                    if k == row_node:
+                        break
+        return True
+
+    def _cover(self, c):
+        L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+        R[L[c]] = R[c]
+        L[R[c]] = L[c]
+        i = D[c]
+        while i != c:
+            j = R[i]
+            while j != i:
+                U[D[j]] = U[j]
+                D[U[j]] = D[j]
+                S[C[j]] -= 1
+                j = R[j]
+            i = D[i]
+
+    def _uncover(self, c):
+        L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+        i = U[c]
+        while i != c:
+            j = L[i]
+            while j != i:
+                S[C[j]] += 1
+                U[D[j]] = j
+                D[U[j]] = j
+                j = L[j]
+            i = U[i]
+        R[L[c]] = c
+        L[R[c]] = c
+
+    def _choose(self):
+        R, S = self.R, self.S
+        c = R[0]
+        best, size = c, S[c]
+        while c and size > 1:
+            if S[c] < size:
+                best, size = c, S[c]
+            c = R[c]
+        return best
+
+    def _solve(self):
+        R, L, D, C, ROW = self.R, self.L, self.D, self.C, self.ROW
+        cover, uncover, choose = self._cover, self._uncover, self._choose
+        props, assign, unassign, cell = \
+            self._props, self._assign, self._unassign, self._cell
+
+        stats, budget = self.stats, self.budget
+        chosen = []
+        if R[0] == 0:
+            if stats is not None:
+                stats.solutions += 1
+            yield ()
+            if budget is not None:
+                budget.solution(self.nodes)
+            return
+        c = choose()
+        if stats is not None:
+            stats.branch(0, self.S[c])
+        cover(c)
+        r = D[c]
+        while True:
+            if r == c:
+                # все кандидаты столбца перебраны - возвращаемся
+                uncover(c)
+                if not chosen:
+                    return
+                r = chosen.pop()
+                if props:
+                    unassign(ROW[r])
+                j = L[r]
+                while j != r:
+                    uncover(C[j])
+                    j = L[j]
+                c = C[r]
+                r = D[r]
+                continue
+
+            if budget is not None and budget.check(self.nodes):
+                return
+            chosen.append(r)
+            self.nodes += 1
+            if stats is not None:
+                stats.nodes += 1
+            j = R[r]
+            while j != r:
+                cover(C[j])
+                j = R[j]
+
+            if not props or assign(ROW[r]):
+                if R[0] != 0:
+                    c = choose()
+                    if stats is not None:
+                        stats.branch(len(chosen), self.S[c])
+                    cover(c)
+                    r = D[c]
+                    continue
+                if stats is not None:
+                    stats.solutions += 1
+                yield tuple(cell(ROW[k]) for k in chosen)
+                if budget is not None and budget.solution(self.nodes):
+                    return
+            elif stats is not None:
+                stats.discarded += 1
+
+            r = chosen.pop()
+            if props:
+                unassign(ROW[r])
+            j = L[r]
+            while j != r:
+                uncover(C[j])
+                j = L[j]
+            c = C[r]
+            r = D[r]
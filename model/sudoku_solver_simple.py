@@ -1,148 +1,162 @@
+from collections import deque
 import model.sudoku_exceptions as ex
+from model.sudoku_grid import Grid
 
 
 class SudokuSimple:
-    def __init__(self, side, order, values, field):
-        self._side, self._order, self._values, self._field = \
-            side, order, values, field
-
-        self._poss_rows = {}
-        self._poss_cols = {}
-        self._poss_house = {}
-        self._possibles = {}
-
-    def _col(self, n):
-        return [r[n] for r in self._iter_row()]
-
-    def _row(self, n):
-        return self._field[n]
-
-    def _iter_col(self):
-        for k in range(self._side):
-            yield self._col(k)
-
-    def _iter_row(self):
-        for k in range(self._side):
-            yield self._row(k)
-
-    def _house(self, row, col):
-        house = []
-        house_i = (row // self._order) * self._order
-        house_j = (col // self._order) * self._order
-        for i in range(house_i, house_i + self._order):
-            for j in range(house_j, house_j + self._order):
-                house.append(self._field[i][j])
-        return house
-
-    def _house_iter(self):
-        for i in range(self._order):
-            for j in range(self._order):
-                yield self._house(i * self._order, j * self._order)
+    # Решение без перебора. Для каждой клетки хранится маска кандидатов
+    # (бит n - 1 для числа n), для каждого блока (строки, столбца, квадрата)
+    # и числа - сколько клеток блока ещё могут его принять. Каждое
+    # исключение кандидата меняет только свои счётчики и ставит в очередь
+    # проверки, которые могли от него сработать:
+    # * naked single - у клетки остался один кандидат
+    # * hidden single - число может стоять только в одной клетке блока
+    # * pointing/claiming - все места числа в квадрате лежат на одной
+    #   линии (или все места в линии - в одном квадрате), тогда число
+    #   исключается из остальной части линии (квадрата)
+    def __init__(self, side, order, field):
+        self._side, self._order, self._field = \
+            side, order, Grid.of(field, order)
+
+        cells = side * side
+        units = []
+        for r in range(side):
+            units.append([r * side + c for c in range(side)])
+        for c in range(side):
+            units.append([r * side + c for r in range(side)])
+        for h in range(side):
+            r0, c0 = (h // order) * order, (h % order) * order
+            units.append([(r0 + i) * side + c0 + j
+                          for i in range(order) for j in range(order)])
+        self._units = units
+        self._cell_units = [(cell // side, side + cell % side,
+                             2 * side + (cell // side // order) * order +
+                             cell % side // order)
+                            for cell in range(cells)]
+
+        self._cands = [(1 << side) - 1] * cells
+        self._values = [0] * cells
+        self._places = [[side] * side for _ in units]
+        self._placed = [0] * len(units)
+        self._queue = deque()
+        self._queued = set()
 
     def solve(self):
-        while not self._is_solved():
-            self._update()
-            singles_found = False or self._find_naked_singles() or \
-                self._find_hidden_singles()
-            if not singles_found:
-                raise ex.SudokuNoSolutionError(
-                    "The Sudoku cannot be solved (no singles found)")
-        yield self._field
-
-    def _set_cell(self, i, j, value):
-        bool_tests = [
-            value in self._possibles[i][j],
-            value in self._poss_rows[i],
-            value in self._poss_cols[j],
-            value in self._poss_house[(i // self._order) * self._order +
-                                      (j // self._order)],
-            value not in self._row(i),
-            value not in self._col(j),
-            value not in self._house(i, j)
-        ]
-        if all(bool_tests):
-            self._field[i][j] = value
-        else:
+        field = self.propagate()
+        if field.count(0):
             raise ex.SudokuNoSolutionError(
-                "Value {0} cannot be set in ({1}, {2})".format(
-                    value, i, j))
-
-    def _is_solved(self):
-        return all([(0 not in row) for row in self._iter_row()])
-
-    def _update(self):
-        for i, (row, col, house) in enumerate(
-                zip(self._iter_row(), self._iter_col(), self._house_iter())):
-            self._poss_rows[i] = set(self._values).difference(set(row))
-            self._poss_cols[i] = set(self._values).difference(set(col))
-            self._poss_house[i] = set(self._values).difference(set(house))
-
-        for i in range(self._side):
-            self._possibles[i] = {}
-            for j in range(self._side):
-                self._possibles[i][j] = set()
-                if self._field[i][j] > 0:
-                    continue
-                this_house_index = ((i // self._order) *
-                                    self._order) + (j // self._order)
-                self._possibles[i][j] = self._poss_rows[i].intersection(
-                    self._poss_cols[j]).intersection(
-                    self._poss_house[this_house_index])
-
-    def _find_naked_singles(self):
-        simple_found = False
-        for i in range(self._side):
-            for j in range(self._side):
-                if self._field[i][j] > 0:
-                    continue
-                p = self._possibles[i][j]
-                if len(p) == 1:
-                    self._set_cell(i, j, list(p)[0])
-                    simple_found = True
-                elif len(p) == 0:
-                    raise ex.SudokuNoSolutionError(
-                        "The Sudoku cannot be solved "
-                        "(no possible value for ({0},{1}))".format(
-                            i, j))
-        return simple_found
-
-    def _find_hidden_singles(self):
-        for i in range(self._side):
-            house_i = (i // self._order) * self._order
-            for j in range(self._side):
-                house_j = (j // self._order) * self._order
-                if self._field[i][j] > 0:
-                    continue
-
-                # rows
-                p = self._possibles[i][j]
-                for c in range(self._side):
-                    if c == j:
-                        continue
-                    p = p.difference(self._possibles[i][c])
-                if len(p) == 1:
-                    self._set_cell(i, j, p.pop())
-                    return True
-
-                # columns
-                p = self._possibles[i][j]
-                for r in range(self._side):
-                    if r == i:
-                        continue
-                    p = p.difference(self._possibles[r][j])
-                if len(p) == 1:
-                    self._set_cell(i, j, p.pop())
-                    return True
-
-                # house
-                p = self._possibles[i][j]
-                for rr in range(house_i, house_i + self._order):
-                    for cc in range(house_j, house_j + self._order):
-                        if rr == i and cc == j:
-                            continue
-                        p = p.difference(self._possibles[rr][cc])
-                if len(p) == 1:
-                    self._set_cell(i, j, p.pop())
-                    return True
-
-        return False
+                "The Sudoku cannot be solved (no singles found)")
+        yield field
+
+    def propagate(self):
+        # Заполняет всё, что следует из правил без перебора, и возвращает
+        # новую таблицу (Grid); SudokuNoSolutionError - если правила
+        # нарушаются
+        for cell, n in enumerate(self._field.flat):
+            if n:
+                self._place(cell, n - 1)
+        self._run()
+        return Grid(self._order, self._values)
+
+    def candidates(self, r, c):
+        # числа, которые ещё могут стоять в пустой клетке (после propagate)
+        mask = self._cands[r * self._side + c]
+        return [n + 1 for n in range(self._side) if mask >> n & 1]
+
+    def _fail(self, cell, why):
+        raise ex.SudokuNoSolutionError(
+            "The Sudoku cannot be solved ({0} in ({1}, {2}))".format(
+                why, *divmod(cell, self._side)))
+
+    def _push(self, task):
+        if task not in self._queued:
+            self._queued.add(task)
+            self._queue.append(task)
+
+    def _place(self, cell, d):
+        if self._values[cell]:
+            if self._values[cell] != d + 1:
+                self._fail(cell, 'two values')
+            return
+        mask = self._cands[cell]
+        if not mask >> d & 1:
+            self._fail(cell, 'value {0} does not fit'.format(d + 1))
+        self._values[cell] = d + 1
+        for e in range(self._side):
+            if e != d and mask >> e & 1:
+                self._eliminate(cell, e)
+        for u in self._cell_units[cell]:
+            self._placed[u] |= 1 << d
+        for u in self._cell_units[cell]:
+            for peer in self._units[u]:
+                if peer != cell:
+                    self._eliminate(peer, d)
+
+    def _eliminate(self, cell, d):
+        bit = 1 << d
+        mask = self._cands[cell]
+        if not mask & bit:
+            return
+        mask &= ~bit
+        self._cands[cell] = mask
+        if not self._values[cell]:
+            if not mask:
+                self._fail(cell, 'no possible value')
+            if not mask & (mask - 1):
+                self._push((0, cell))
+        for u in self._cell_units[cell]:
+            places = self._places[u]
+            places[d] -= 1
+            if self._placed[u] & bit:
+                continue
+            if not places[d]:
+                self._fail(cell, 'no place for {0}'.format(d + 1))
+            if places[d] == 1:
+                self._push((1, u, d))
+            elif places[d] <= self._order:
+                self._push((2, u, d))
+
+    def _run(self):
+        queue, queued = self._queue, self._queued
+        while queue:
+            task = queue.popleft()
+            queued.discard(task)
+            if task[0] == 0:
+                cell = task[1]
+                if not self._values[cell]:
+                    self._place(cell, self._cands[cell].bit_length() - 1)
+            elif task[0] == 1:
+                self._hidden_single(task[1], task[2])
+            else:
+                self._box_line(task[1], task[2])
+
+    def _hidden_single(self, u, d):
+        if self._placed[u] >> d & 1:
+            return
+        for cell in self._units[u]:
+            if self._cands[cell] >> d & 1:
+                self._place(cell, d)
+                return
+
+    def _box_line(self, u, d):
+        if self._placed[u] >> d & 1:
+            return
+        side = self._side
+        cells = [cell for cell in self._units[u] if self._cands[cell] >> d & 1]
+        if u >= 2 * side:
+            # pointing: все места в квадрате на одной строке или столбце
+            rows = {cell // side for cell in cells}
+            cols = {cell % side for cell in cells}
+            lines = []
+            if len(rows) == 1:
+                lines.append(rows.pop())
+            if len(cols) == 1:
+                lines.append(side + cols.pop())
+        else:
+            # claiming: все места в линии внутри одного квадрата
+            boxes = {self._cell_units[cell][2] for cell in cells}
+            lines = [boxes.pop()] if len(boxes) == 1 else []
+        for line in lines:
+            for cell in self._units[line]:
+                if cell not in cells:
+                    self._eliminate(cell, d)
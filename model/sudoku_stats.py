@@ -0,0 +1,138 @@
+import time
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class SolveStats:
+    # Необязательная статистика решения: время (и при memory=True пиковая
+    # память tracemalloc) по этапам и счётчики перебора. Решатели
+    # обновляют её, только если она им передана, поэтому без неё перебор
+    # не замедляется
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.phases = OrderedDict()
+        self.peaks = OrderedDict()
+        self.peak = None
+        # узлы перебора (испробованные кандидаты), тупики (выбран столбец
+        # без кандидатов), наибольшая глубина, найденные решения и
+        # частичные решения, отброшенные доп. условиями
+        self.nodes = 0
+        self.backtracks = 0
+        self.max_depth = 0
+        self.solutions = 0
+        self.discarded = 0
+        # branching[d] = [сколько раз выбирался столбец на глубине d,
+        #                 сколько у него было кандидатов в сумме]
+        self.branching = []
+        self._started = False
+
+    def start(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started = True
+
+    def stop(self):
+        if self.memory and tracemalloc.is_tracing():
+            self.peak = tracemalloc.get_traced_memory()[1]
+            if self._started:
+                tracemalloc.stop()
+                self._started = False
+
+    @contextmanager
+    def phase(self, name):
+        start = self._enter()
+        try:
+            yield
+        finally:
+            self._leave(name, start)
+
+    def timed(self, name, iterable):
+        # время считается только внутри next(), без времени того,
+        # кто забирает значения
+        it = iter(iterable)
+        while True:
+            start = self._enter()
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            finally:
+                self._leave(name, start)
+            yield item
+
+    def branch(self, depth, candidates):
+        while len(self.branching) <= depth:
+            self.branching.append([0, 0])
+        level = self.branching[depth]
+        level[0] += 1
+        level[1] += candidates
+        if not candidates:
+            self.backtracks += 1
+        if depth + 1 > self.max_depth:
+            self.max_depth = depth + 1
+
+    def _enter(self):
+        if self.memory and tracemalloc.is_tracing() and \
+                hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        return time.perf_counter()
+
+    def _leave(self, name, start):
+        self.phases[name] = self.phases.get(name, 0) + \
+            time.perf_counter() - start
+        if self.memory and tracemalloc.is_tracing():
+            peak = tracemalloc.get_traced_memory()[1]
+            self.peaks[name] = max(self.peaks.get(name, 0), peak)
+
+    def as_dict(self):
+        return {
+            'phases': dict(self.phases),
+            'peaks': dict(self.peaks),
+            'peak': self.peak,
+            'nodes': self.nodes,
+            'backtracks': self.backtracks,
+            'max_depth': self.max_depth,
+            'solutions': self.solutions,
+            'discarded': self.discarded,
+            'branching': [round(c / n, 2) if n else 0
+                          for n, c in self.branching],
+        }
+
+    def report(self):
+        lines = ['Phases:']
+        for name, seconds in self.phases.items():
+            line = '  {:12} {:10.3f} ms'.format(name, seconds * 1000)
+            if name in self.peaks:
+                line += '  peak {:.1f} KiB'.format(self.peaks[name] / 1024)
+            lines.append(line)
+        if self.peak is not None:
+            lines.append('Peak memory: {:.1f} KiB'.format(self.peak / 1024))
+        lines.append('Nodes: {}, backtracks: {}, max depth: {}, '
+                     'solutions: {}, discarded by conditions: {}'.format(
+                         self.nodes, self.backtracks, self.max_depth,
+                         self.solutions, self.discarded))
+        if self.branching:
+            # глубины без ветвления (один кандидат) не выводятся
+            total = sum(n for n, _ in self.branching)
+            mean = sum(c for _, c in self.branching) / total
+            lines.append('Branching: mean {:.2f}'.format(mean) + ''.join(
+                ', depth {} - {:.2f}'.format(d, c / n)
+                for d, (n, c) in enumerate(self.branching) if c > n))
+        return '\n'.join(lines)
+
+
+class _NoPhase:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        return False
+
+
+_no_phase = _NoPhase()
+
+
+def phase(stats, name):
+    # stats.phase(name), если статистика включена, иначе пустой контекст
+    return _no_phase if stats is None else stats.phase(name)
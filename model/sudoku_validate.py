@@ -0,0 +1,130 @@
+from itertools import islice
+from model.sudoku_grid import Grid
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# сколько таблиц проверяется за один проход, если они приходят не массивом
+CHUNK = 1 << 16
+# коды нарушений, кроме номеров блоков: блоки 0..side-1 - строки,
+# side..2*side-1 - столбцы, 2*side..3*side-1 - квадраты
+OK = -1
+CELLS = -2
+FIRST = -3
+SECOND = -4
+
+
+def validate(grids, order=None, first_cond=False, colors=None,
+             complete=True):
+    # Проверяет сразу много таблиц одного порядка: массив (N, side, side)
+    # или последовательность Grid / списков строк. complete=True - пустые
+    # клетки тоже нарушение (проверяются решения), иначе проверяются только
+    # повторы (задачи). Условия проверяются только у заполненных таблиц.
+    # Возвращает два массива длины N: ok (bool) и unit - первое найденное
+    # нарушение (OK, CELLS, номер блока, FIRST или SECOND; см. describe)
+    require_numpy()
+    if isinstance(grids, np.ndarray):
+        if order is None:
+            order = int(round(grids.shape[-1] ** 0.5))
+        return _validate(grids, order, first_cond, colors, complete)
+    oks, units = [], []
+    it = iter(grids)
+    while True:
+        chunk = list(islice(it, CHUNK))
+        if not chunk:
+            break
+        array = to_array(chunk)
+        if order is None:
+            order = int(round(array.shape[-1] ** 0.5))
+        ok, unit = _validate(array, order, first_cond, colors, complete)
+        oks.append(ok)
+        units.append(unit)
+    if not oks:
+        return np.zeros(0, bool), np.zeros(0, np.int16)
+    return np.concatenate(oks), np.concatenate(units)
+
+
+def to_array(grids):
+    # (N, side, side) uint8 из Grid (одним копированием буферов)
+    # или из списков строк
+    require_numpy()
+    grids = list(grids)
+    if grids and all(isinstance(g, Grid) for g in grids):
+        side = grids[0].side
+        data = b''.join(g.flat for g in grids)
+        return np.frombuffer(data, np.uint8).reshape(len(grids), side, side)
+    return np.asarray(grids, dtype=np.uint8)
+
+
+def describe(unit, side):
+    unit = int(unit)
+    if unit == OK:
+        return 'ok'
+    if unit == CELLS:
+        return 'empty or out of range cells'
+    if unit == FIRST:
+        return 'first condition'
+    if unit == SECOND:
+        return 'second condition'
+    kind, k = divmod(unit, side)
+    return '{} {}'.format(('row', 'column', 'house')[kind], k + 1)
+
+
+def require_numpy():
+    if np is None:
+        raise ImportError(
+            'Batch validation needs NumPy (pip install numpy)')
+
+
+def _validate(grids, order, first_cond, colors, complete):
+    side = order ** 2
+    n = len(grids)
+    grids = grids.reshape(n, side, side)
+    unit = np.full(n, OK, np.int16)
+
+    empty = (grids == 0).any(axis=(1, 2))
+    bad = (grids > side).any(axis=(1, 2))
+    if complete:
+        bad |= empty
+    unit[bad] = CELLS
+
+    # строки, столбцы и квадраты - (N, 3 * side, side); после сортировки
+    # повтор - два одинаковых ненулевых соседа
+    houses = grids.reshape(n, order, order, order, order) \
+        .transpose(0, 1, 3, 2, 4).reshape(n, side, side)
+    units = np.sort(np.concatenate(
+        (grids, grids.transpose(0, 2, 1), houses), axis=1), axis=2)
+    dups = ((units[:, :, 1:] == units[:, :, :-1]) &
+            (units[:, :, 1:] != 0)).any(axis=2)
+    has_dup = dups.any(axis=1) & (unit == OK)
+    unit[has_dup] = dups.argmax(axis=1)[has_dup]
+
+    full = ~empty
+    if first_cond:
+        # на каждом уголке после сортировки ровно одна пара соседей равна
+        # (ровно одна пара одинаковых чисел и нет тройки)
+        cen = side // 2
+        a = list(range(cen + 1)) + list(reversed(range(cen)))
+        b = list(reversed(range(cen, side))) + list(range(cen + 1, side))
+        cols = np.arange(side)
+        ok = np.ones(n, bool)
+        for rows in (a, b):
+            corner = np.sort(grids[:, rows, cols], axis=1)
+            ok &= (corner[:, 1:] == corner[:, :-1]).sum(axis=1) == 1
+        failed = ~ok & full & (unit == OK)
+        unit[failed] = FIRST
+
+    if colors and len(colors) > 1:
+        if not all(-1 < v < side * side for tup in colors for v in tup):
+            raise ValueError(
+                'Cell numbers in the second condition are out of range')
+        flat = grids.reshape(n, side * side).astype(np.int64)
+        sums = np.stack([flat[:, list(tup)].sum(axis=1) for tup in colors],
+                        axis=1)
+        ok = (sums == sums[:, :1]).all(axis=1)
+        failed = ~ok & full & (unit == OK)
+        unit[failed] = SECOND
+
+    return unit == OK, unit
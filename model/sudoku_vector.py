@@ -0,0 +1,167 @@
+from itertools import islice
+import model.sudoku_exceptions as ex
+from model.sudoku_batch import BatchResult, solve_batch
+from model.sudoku_grid import Grid
+from model.sudoku_parser import Puzzle
+from model.sudoku_solver import Sudoku
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# сколько судоку распространяется за один проход
+CHUNK = 4096
+# итог propagate для каждой судоку
+SOLVED = 1
+STUCK = 0
+# противоречие: решений нет
+CONTRADICTION = -1
+# повторы среди заданных клеток
+INVALID = -2
+
+_layouts = {}
+
+
+def propagate(values, order):
+    # Naked и hidden singles сразу для N судоку одного порядка: values -
+    # (N, side * side) uint8, 0 - пустая клетка. На каждом проходе по
+    # заполненным клеткам строится тензор кандидатов (N, клетки, числа), и
+    # все найденные singles ставятся одновременно; судоку, в которых ничего
+    # не нашлось, из прохода выбывают. Возвращает новые значения и статус
+    # каждой судоку (SOLVED, STUCK, CONTRADICTION, INVALID)
+    require_numpy()
+    unit_cells, member = _layout(order)
+    side = order ** 2
+    digits = np.arange(1, side + 1, dtype=np.uint8)
+    values = np.array(values, np.uint8).reshape(len(values), side * side)
+    status = np.full(len(values), STUCK, np.int8)
+    active = np.arange(len(values))
+    first = True
+    while len(active):
+        # счёты по блокам - умножение на матрицу принадлежности клеток
+        # блокам (member, блоки x клетки) во float32, через BLAS
+        v = values[active]
+        onehot = (v[:, :, None] == digits).astype(np.float32)
+        counts = member @ onehot
+        placed = counts > 0
+        empty = v == 0
+        cand = ((member.T @ placed.astype(np.float32)) == 0) & \
+            empty[:, :, None]
+        places = member @ cand.astype(np.float32)
+
+        dup = (counts > 1).any(axis=(1, 2))
+        if first:
+            status[active[dup]] = INVALID
+            first = False
+        bad = dup | (empty & ~cand.any(axis=2)).any(axis=1) | \
+            ((places == 0) & ~placed).any(axis=(1, 2))
+        done = ~empty.any(axis=1) & ~bad
+        naked = empty & (cand.sum(axis=2) == 1)
+        hidden = (places == 1) & ~placed
+        going = (naked.any(axis=1) | hidden.any(axis=(1, 2))) & ~bad & ~done
+
+        k, cell = naked.nonzero()
+        v[k, cell] = cand[k, cell].argmax(axis=1) + 1
+        k, u, d = hidden.nonzero()
+        cells = unit_cells[u]
+        v[k, cells[np.arange(len(k)), cand[k[:, None], cells, d[:, None]]
+                   .argmax(axis=1)]] = d + 1
+        values[active] = v
+
+        status[active[bad & (status[active] != INVALID)]] = CONTRADICTION
+        status[active[done]] = SOLVED
+        active = active[going]
+    return values, status
+
+
+def solve_vectorized(puzzles, num=1, first_cond=False, second_cond=False,
+                     workers=None, chunksize=16, chunk=CHUNK, engine='bf'):
+    # То же, что sudoku_batch.solve_batch (puzzles - всё, что принимает
+    # Sudoku, или ошибки разбора из iter_puzzles), но судоку сначала
+    # порциями по chunk проходят через propagate. Решённые так судоку
+    # отдаются сразу, а оставшиеся после этого перебором решаются в
+    # solve_batch, поэтому результаты идут не в порядке входных данных
+    require_numpy()
+    it = enumerate(puzzles)
+    while True:
+        block = list(islice(it, chunk))
+        if not block:
+            break
+        groups = {}
+        for index, inp in block:
+            try:
+                if isinstance(inp, ex.SudokuException):
+                    raise inp
+                if isinstance(inp, Puzzle) and not first_cond and \
+                        not second_cond:
+                    sudoku = None
+                    order, field, colors = inp.order, inp.field, inp.colors
+                else:
+                    sudoku = Sudoku(inp, first_cond, second_cond)
+                    order, field, colors = \
+                        sudoku._order, sudoku._field, sudoku.second_colors
+            except ex.SudokuException as e:
+                yield BatchResult(index, [], str(e))
+                continue
+            groups.setdefault(order, []).append(
+                (index, field, colors, sudoku))
+
+        stuck = []
+        for order, items in groups.items():
+            values, status = propagate(
+                [np.frombuffer(field.flat, np.uint8)
+                 for _, field, _, _ in items], order)
+            for (index, field, colors, sudoku), row, st in \
+                    zip(items, values, status):
+                grid = Grid(order, row.tobytes())
+                if st == INVALID:
+                    # текст ошибки - как у Sudoku
+                    try:
+                        Sudoku(Puzzle(order, field, colors, None, None))
+                    except ex.SudokuException as e:
+                        yield BatchResult(index, [], str(e))
+                elif st == CONTRADICTION or num == 0:
+                    yield BatchResult(index, [], None)
+                elif st == SOLVED:
+                    ok = sudoku is None or _check_conditions(sudoku, grid)
+                    yield BatchResult(index, [grid] if ok else [], None)
+                else:
+                    stuck.append(
+                        (index, Puzzle(order, grid, colors, None, None)))
+
+        results = solve_batch([p for _, p in stuck], num, first_cond,
+                              second_cond, workers, chunksize,
+                              engine=engine)
+        for res in results:
+            yield res._replace(index=stuck[res.index][0])
+
+
+def _check_conditions(sudoku, grid):
+    if sudoku.first_cond and \
+            not Sudoku._check_first_cond(sudoku._side, grid):
+        return False
+    return not sudoku.second_cond or \
+        Sudoku._check_second_cond(grid, sudoku.second_colors)
+
+
+def _layout(order):
+    # клетки каждого блока (3 * side, side) и матрица принадлежности
+    # клеток блокам (3 * side, клетки)
+    layout = _layouts.get(order)
+    if layout is None:
+        side = order ** 2
+        cells = np.arange(side * side).reshape(side, side)
+        houses = cells.reshape(order, order, order, order) \
+            .transpose(0, 2, 1, 3).reshape(side, side)
+        unit_cells = np.concatenate((cells, cells.T, houses))
+        member = np.zeros((3 * side, side * side), np.float32)
+        member[np.arange(3 * side)[:, None], unit_cells] = 1
+        layout = _layouts[order] = unit_cells, member
+    return layout
+
+
+def require_numpy():
+    if np is None:
+        raise ImportError(
+            'Vectorized solving needs NumPy (pip install numpy)')
@@ -79,8 +79,11 @@ box = []
 row = []
 column = []
 initiate()
-inputs()
-solve()
-for i in range(9):
-    print(grid[i * 9:i * 9 + 9])
-input()
+
+if __name__ == '__main__':
+    # тот же перебор для любого порядка - model/sudoku_solver_bitmask.py
+    inputs()
+    solve()
+    for i in range(9):
+        print(grid[i * 9:i * 9 + 9])
+    input()
@@ -1,8 +1,25 @@
 import argparse
+import asyncio
+import json
+import os
+import signal
 import sys
 from itertools import islice
 from model.sudoku_solver import Sudoku, SudokuGen
+from model.sudoku_batch import solve_batch
+import model.sudoku_vector as vector
+from model.sudoku_parser import iter_puzzles
+import model.sudoku_validate as validator
+import model.sudoku_bench as bench
+import model.sudoku_output as output
+from model.sudoku_cache import SolutionCache
+from model.sudoku_checkpoint import Checkpoint, load as load_checkpoint
+import model.sudoku_engines as engines
+from model.sudoku_parallel import solve_parallel, count_parallel
+from model.sudoku_server import SudokuServer
 from model.utils import str_to_tuples, tuples_to_str
+from model.sudoku_budget import Budget, CancelToken
+from model.sudoku_stats import SolveStats, phase
 import model.sudoku_exceptions as ex
 
 
@@ -15,10 +32,14 @@ def main():
 
     subparsers = parser.add_subparsers(
         title='Commands',
-        metavar='s|g',
+        metavar='s|g|b|v|m|serve',
         description='Solve or Generate a Sudoku',
         help='For using this program in solving mode use "s"\n'
-             'For using this program in generator mode use "g"\n\n'
+             'For using this program in generator mode use "g"\n'
+             'For solving many Sudoku from one file use "b"\n'
+             'For checking many filled or unfilled grids use "v"\n'
+             'For measuring the solvers\' performance use "m"\n'
+             'For running a local solving service use "serve"\n\n'
              'Use --help for each mode to see more'
     )
     parser_solver = subparsers.add_parser('s')
@@ -26,9 +47,8 @@ def main():
     solver_params.add_argument(
         '-n', '--solution-number',
         type=int,
-        default=1,
         help='Number of solutions to find and print '
-             '(-1 to show all solutions)',
+             '(-1 to show all solutions, default: 1)',
         metavar='NUM'
     )
     solver_params.add_argument(
@@ -42,6 +62,109 @@ def main():
         cell numbers must be stated like this: # 3,45,10_4,70_11,69,80""",
         action='store_true'
     )
+    solver_params.add_argument(
+        '-c', '--count',
+        action='store_true',
+        help='Only print the number of solutions\n'
+             '(all of them, or at most NUM if -n is stated)'
+    )
+    solver_params.add_argument(
+        '-d', '--delta',
+        action='store_true',
+        help='Print only the filled cells of each solution '
+             'as "row col value"'
+    )
+    solver_params.add_argument(
+        '--format',
+        choices=output.FORMATS,
+        default='text',
+        help='Output format of solutions (default: text):\n'
+             'packed - binary records, 4 bits per cell;\n'
+             'packed-delta - only cells that are empty in the Sudoku\n'
+             '(see model/sudoku_output.py)'
+    )
+    solver_params.add_argument(
+        '-o', '--output',
+        help='Write solutions to a file instead of stdout',
+        metavar='PATH'
+    )
+    solver_params.add_argument(
+        '-e', '--engine',
+        choices=engines.names(),
+        default='bf',
+        help='Search algorithm (default: bf); auto picks one by the\n'
+             'order and the share of filled cells'
+    )
+    solver_params.add_argument(
+        '-P', '--presolve',
+        action='store_true',
+        help='Fill cells that follow from the rules (singles, '
+             'pointing/claiming)\nbefore the search'
+    )
+    solver_params.add_argument(
+        '-j', '--jobs',
+        type=int,
+        help='Search in NUM processes (0 - number of CPUs);\n'
+             'cannot be combined with --presolve, --cache, --timeout '
+             'and --max-nodes',
+        metavar='NUM'
+    )
+    solver_params.add_argument(
+        '--ordered',
+        action='store_true',
+        help='With --jobs, print solutions in the same order '
+             'from run to run'
+    )
+    solver_params.add_argument(
+        '-t', '--timeout',
+        type=float,
+        help='Stop the search after SEC seconds',
+        metavar='SEC'
+    )
+    solver_params.add_argument(
+        '--max-nodes',
+        type=int,
+        help='Stop the search after trying NUM candidates',
+        metavar='NUM'
+    )
+    solver_params.add_argument(
+        '--checkpoint',
+        help='Save the search position to PATH every SEC seconds\n'
+             '(see --checkpoint-interval) and when the search stops',
+        metavar='PATH'
+    )
+    solver_params.add_argument(
+        '--checkpoint-interval',
+        type=float,
+        default=60.0,
+        help='Seconds between saves of the search position '
+             '(default: 60)',
+        metavar='SEC'
+    )
+    solver_params.add_argument(
+        '--resume',
+        help='Continue the search saved with --checkpoint (the same\n'
+             'Sudoku and -f, -s, -P); the position keeps being saved\n'
+             'to PATH unless --checkpoint is stated. With -o, solutions\n'
+             'are appended to the file',
+        metavar='PATH'
+    )
+    solver_params.add_argument(
+        '--stats',
+        action='store_true',
+        help='Print time of each phase and search counters to stderr'
+    )
+    solver_params.add_argument(
+        '--profile',
+        action='store_true',
+        help='Like --stats, plus peak memory of each phase (tracemalloc)'
+    )
+    solver_params.add_argument(
+        '--cache',
+        help='Keep found solutions in a sqlite file and reuse them\n'
+             'for the same Sudoku (including a smaller or bigger NUM)',
+        metavar='PATH'
+    )
     solver_params.add_argument(
         'filename',
         nargs='?',
@@ -69,6 +192,33 @@ def main():
         Example: 3,45,10_4,70_11,69,80""",
         action='store_true'
     )
+    generator_params.add_argument(
+        '-u', '--unique',
+        action='store_true',
+        help='Generate a Sudoku with exactly one solution\n'
+             '(removes cells while the solution stays unique, '
+             'stops at PERCENT)'
+    )
+    generator_params.add_argument(
+        '--givens',
+        type=int,
+        help='Like --unique, but stop at NUM filled cells '
+             'instead of PERCENT',
+        metavar='NUM'
+    )
+    generator_params.add_argument(
+        '--minimal',
+        action='store_true',
+        help='Like --unique, but remove cells while it is possible'
+    )
+    generator_params.add_argument(
+        '--max-transforms',
+        type=int,
+        default=20000,
+        help='How many transforms to try to satisfy the conditions '
+             '(default: 20000)',
+        metavar='NUM'
+    )
     generator_params.add_argument(
         'size',
         type=int,
@@ -90,30 +240,358 @@ def main():
              '(creates one if not exists)'
     )
 
+    parser_batch = subparsers.add_parser('b')
+    batch_params = parser_batch.add_argument_group(title='Parameters')
+    batch_params.add_argument(
+        '-n', '--solution-number',
+        type=int,
+        default=1,
+        help='Number of solutions to find and print for each Sudoku '
+             '(-1 to show all solutions)',
+        metavar='NUM'
+    )
+    batch_params.add_argument(
+        '-f', '--first',
+        action='store_true',
+        help='Find solutions that matches the first condition'
+    )
+    batch_params.add_argument(
+        '-s', '--second',
+        action='store_true',
+        help='Find solutions that matches the second condition'
+    )
+    batch_params.add_argument(
+        '-P', '--presolve',
+        action='store_true',
+        help='Fill cells that follow from the rules before the search'
+    )
+    batch_params.add_argument(
+        '-e', '--engine',
+        choices=engines.names(),
+        default='bf',
+        help='Search algorithm (default: bf); auto picks one\n'
+             'for each Sudoku'
+    )
+    batch_params.add_argument(
+        '-V', '--vectorized',
+        action='store_true',
+        help='Fill singles in all Sudoku at once with NumPy and search\n'
+             'only in those left unsolved (results are not in input order)'
+    )
+    batch_params.add_argument(
+        '-w', '--workers',
+        type=int,
+        help='Number of worker processes (default: number of CPUs)',
+        metavar='NUM'
+    )
+    batch_params.add_argument(
+        '-c', '--chunk-size',
+        type=int,
+        default=16,
+        help='Number of Sudoku sent to a worker at once',
+        metavar='NUM'
+    )
+    batch_params.add_argument(
+        'filename',
+        nargs='?',
+        type=argparse.FileType(),
+        help='File with Sudoku: blocks of rows or one Sudoku per line\n'
+             '(if not stated, read from stdin)'
+    )
+    parser_batch.set_defaults(batch=True)
+
+    parser_valid = subparsers.add_parser('v')
+    valid_params = parser_valid.add_argument_group(title='Parameters')
+    valid_params.add_argument(
+        '-f', '--first',
+        action='store_true',
+        help='Check the first condition'
+    )
+    valid_params.add_argument(
+        '-s', '--second',
+        action='store_true',
+        help='Check the second condition (cells from "#" lines)'
+    )
+    valid_params.add_argument(
+        '-p', '--partial',
+        action='store_true',
+        help='Allow empty cells (check unsolved Sudoku)'
+    )
+    valid_params.add_argument(
+        'filename',
+        nargs='?',
+        type=argparse.FileType(),
+        help='File with grids, in any format of the "b" mode\n'
+             '(if not stated, read from stdin)'
+    )
+    parser_valid.set_defaults(validate=True)
+
+    parser_bench = subparsers.add_parser('m', aliases=['bench'])
+    bench_params = parser_bench.add_argument_group(title='Parameters')
+    bench_params.add_argument(
+        '-e', '--engines',
+        default='bf,dlx,bitmask',
+        help='Comma separated solvers to measure '
+             '(default: bf,dlx,bitmask)',
+        metavar='NAMES'
+    )
+    bench_params.add_argument(
+        '--orders',
+        default='2,3,4,5',
+        help='Orders of generated Sudoku (default: 2,3,4,5)',
+        metavar='ORDERS'
+    )
+    bench_params.add_argument(
+        '--count',
+        type=int,
+        default=10,
+        help='Number of generated Sudoku of each order (default: 10)',
+        metavar='NUM'
+    )
+    bench_params.add_argument(
+        '--seed',
+        type=int,
+        default=0,
+        help='Seed for generated Sudoku (default: 0)',
+        metavar='NUM'
+    )
+    bench_params.add_argument(
+        '--limit',
+        type=int,
+        default=1000,
+        help='Stop the full search after NUM solutions (default: 1000)',
+        metavar='NUM'
+    )
+    bench_params.add_argument(
+        '--repeat',
+        type=int,
+        default=3,
+        help='Take the best of NUM time measurements (default: 3)',
+        metavar='NUM'
+    )
+    bench_params.add_argument(
+        '--no-memory',
+        action='store_true',
+        help='Do not measure peak memory (tracemalloc)'
+    )
+    bench_params.add_argument(
+        '-o', '--output',
+        type=argparse.FileType('w'),
+        help='Write results as JSON',
+        metavar='PATH'
+    )
+    bench_params.add_argument(
+        '--baseline',
+        type=argparse.FileType(),
+        help='Compare with results of an earlier run, '
+             'exit with 1 on regressions',
+        metavar='PATH'
+    )
+    bench_params.add_argument(
+        '--threshold',
+        type=float,
+        default=0.2,
+        help='Allowed slowdown against the baseline (default: 0.2)',
+        metavar='FRACTION'
+    )
+    parser_bench.set_defaults(bench=True)
+
+    parser_serve = subparsers.add_parser('serve')
+    serve_params = parser_serve.add_argument_group(title='Parameters')
+    serve_params.add_argument(
+        '--host',
+        default='127.0.0.1',
+        help='Address to listen on (default: 127.0.0.1)'
+    )
+    serve_params.add_argument(
+        '--port',
+        type=int,
+        default=8765,
+        help='TCP port to listen on (default: 8765)'
+    )
+    serve_params.add_argument(
+        '--unix',
+        help='Listen on a Unix socket instead of TCP',
+        metavar='PATH'
+    )
+    serve_params.add_argument(
+        '-w', '--workers',
+        type=int,
+        help='Number of worker processes (default: number of CPUs)',
+        metavar='NUM'
+    )
+    serve_params.add_argument(
+        '--queue',
+        type=int,
+        default=100,
+        help='Requests waiting for a worker before new ones\n'
+             'are rejected as busy (default: 100)',
+        metavar='NUM'
+    )
+    serve_params.add_argument(
+        '-t', '--timeout',
+        type=float,
+        default=30.0,
+        help='Longest search for one request (default: 30)',
+        metavar='SEC'
+    )
+    parser_serve.set_defaults(serve=True)
+
     args = parser.parse_args()
+    if 'batch' in args:
+        batch(args)
+        return
+    if 'bench' in args:
+        benchmark(args)
+        return
+    if 'validate' in args:
+        validate(args)
+        return
+    if 'serve' in args:
+        try:
+            asyncio.run(serve(args))
+        except KeyboardInterrupt:
+            pass
+        return
+
     if 'size' not in args:
+        if args.jobs is not None and (
+                args.presolve or args.cache or args.timeout is not None or
+                args.max_nodes is not None):
+            parser.error('--jobs cannot be combined with --presolve, '
+                         '--cache, --timeout and --max-nodes')
+        if (args.checkpoint or args.resume) and (
+                args.jobs is not None or args.cache):
+            parser.error('--checkpoint and --resume cannot be combined '
+                         'with --jobs and --cache')
+        if args.engine != 'bf' and (
+                args.jobs is not None or args.checkpoint or args.resume):
+            parser.error('--jobs, --checkpoint and --resume work only '
+                         'with --engine bf')
+        if args.delta and args.format != 'text':
+            parser.error('--delta cannot be combined with binary formats, '
+                         'use --format packed-delta')
         num = args.solution_number
         f_rule = args.first
         s_rule = args.second
         file = args.filename
+        if num is None:
+            num = None if args.count else 1
         num = None if num == -1 else num
+        stats = None
+        cache = None
+        if args.stats or args.profile:
+            stats = SolveStats(memory=args.profile)
+            stats.start()
         try:
-            if file:
-                sudoku = Sudoku(file.read(), f_rule, s_rule).solve()
-            else:
+            if not file:
                 print('Please enter Sudoku:')
-                inp = sys.stdin.readlines()
-                sudoku = Sudoku(inp, f_rule, s_rule).solve()
-            any_sols = False
-            for i, sol in enumerate(islice(sudoku, num)):
-                any_sols = True
-                print('Solution {}:'.format(i + 1))
-                print(p_sol(sol))
-            if not any_sols:
-                print('No solutions')
+            sudoku = Sudoku(file or sys.stdin, f_rule, s_rule, stats)
+            engine = engines.get(args.engine, sudoku, num)
+            token = CancelToken()
+            budget = Budget(args.timeout, args.max_nodes, token=token)
+            if args.jobs is None:
+                # Ctrl+C останавливает перебор, а найденное выводится
+                signal.signal(signal.SIGINT, lambda *_: token.cancel())
+            options = {'budget': budget}
+            checkpoint = None
+            resumed = 0
+            saved_output = None
+            keys = {'first': f_rule, 'second': s_rule,
+                    'presolve': args.presolve}
+            if args.resume:
+                state = load_checkpoint(args.resume)
+                extra = state.get('extra') or {}
+                if extra.get('keys') != keys:
+                    raise ex.SudokuCheckpointError(
+                        'The saved search was run with other -f, -s, -P')
+                options['resume'] = state
+                resumed = state['solutions']
+                saved_output = extra.get('output')
+            if args.checkpoint or args.resume:
+                checkpoint = Checkpoint(
+                    args.checkpoint or args.resume,
+                    args.checkpoint_interval,
+                    lambda: checkpoint_extra(keys))
+                options['checkpoint'] = checkpoint
+                # остановка сервиса тоже сохраняет позицию
+                signal.signal(signal.SIGTERM, lambda *_: token.cancel())
+            if args.jobs is not None:
+                workers = args.jobs or None
+                if args.count:
+                    print('Solutions: {}'.format(
+                        count_parallel(sudoku, workers)
+                        if num is None else sudoku.count(num)))
+                    return
+                solutions = solve_parallel(sudoku, workers, args.ordered,
+                                           not args.delta)
+            elif args.cache:
+                cache = SolutionCache(path=args.cache)
+                solutions = cache.solve(sudoku, num, engine,
+                                        materialize=not args.delta,
+                                        presolve=args.presolve,
+                                        budget=budget)
+            elif not args.count:
+                solutions = sudoku.solve(engine, not args.delta,
+                                         presolve=args.presolve,
+                                         **options)
+            if num is not None:
+                # num - сколько решений всего, вместе с найденными до resume
+                num = max(0, num - resumed)
+            if args.count:
+                if args.cache:
+                    count = sum(1 for _ in solutions)
+                else:
+                    count = resumed + sudoku.count(
+                        num, engine, args.presolve, **options)
+                if checkpoint is not None:
+                    checkpoint.save()
+                print('Solutions: {}'.format(count))
+                p_budget(budget)
+                return
+            # вывод копится и пишется большими кусками
+            binary = args.format != 'text'
+            append = args.output and saved_output is not None and \
+                os.path.exists(args.output)
+            if append:
+                # решения, выведенные после сохранения позиции, будут
+                # найдены заново
+                os.truncate(args.output, saved_output)
+                out = open(args.output, 'ab' if binary else 'a')
+            elif args.output:
+                out = open(args.output, 'wb' if binary else 'w')
+            else:
+                out = sys.stdout.buffer if binary else sys.stdout
+            try:
+                with output.writer(args.format, out, sudoku.field,
+                                   args.delta, start=resumed,
+                                   header=not append) as writer:
+                    if checkpoint is not None:
+                        checkpoint.before_save = lambda: checkpoint_extra(
+                            keys, writer, out if args.output else None)
+                    for sol in islice(solutions, num):
+                        with phase(stats, 'format'):
+                            writer.write(sol)
+                    if checkpoint is not None:
+                        checkpoint.save()
+            finally:
+                if args.output:
+                    out.close()
+            if not writer.count:
+                print('No solutions',
+                      file=sys.stderr if binary else sys.stdout)
+            p_budget(budget)
         except ex.SudokuException as e:
             print(e, file=sys.stderr)
             sys.exit(1)
+        finally:
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            if cache is not None:
+                cache.close()
+            if stats is not None:
+                stats.stop()
+                print(stats.report(), file=sys.stderr)
 
     if 'solution_number' not in args:
         p_gen_sol = args.print_solution
@@ -133,7 +611,9 @@ def main():
         file = args.filepath
 
         try:
-            gen = SudokuGen(size, percent, f_rule, s_rule)
+            gen = SudokuGen(size, percent, f_rule, s_rule,
+                            args.unique, args.givens, args.minimal,
+                            args.max_transforms)
         except ex.SudokuGeneratorError as e:
             print(e, file=sys.stderr)
             sys.exit(2)
@@ -148,14 +628,142 @@ def main():
             print(p_sol(gen.ref_table))
 
 
+def batch(args):
+    num = None if args.solution_number == -1 else args.solution_number
+    file = args.filename or sys.stdin
+    puzzles = iter_puzzles(file, errors='yield')
+    if args.vectorized:
+        need_numpy(vector)
+        results = vector.solve_vectorized(
+            puzzles, num, args.first, args.second, args.workers,
+            args.chunk_size, engine=args.engine)
+    else:
+        results = solve_batch(puzzles, num, args.first, args.second,
+                              args.workers, args.chunk_size, args.presolve,
+                              args.engine)
+    failed = 0
+    for res in results:
+        if res.error:
+            failed += 1
+            print('Puzzle {}: {}'.format(res.index + 1, res.error))
+            continue
+        print('Puzzle {}:'.format(res.index + 1))
+        if not res.solutions:
+            print('No solutions')
+        for i, sol in enumerate(res.solutions):
+            print('Solution {}:'.format(i + 1))
+            print(p_sol(sol))
+    if failed:
+        sys.exit(1)
+
+
+def validate(args):
+    # таблицы проверяются порциями, внутри порции - группами
+    # одного порядка и с одинаковыми цветами
+    need_numpy(validator)
+    puzzles = iter_puzzles(args.filename or sys.stdin, errors='yield')
+    total = valid = 0
+    while True:
+        chunk = list(islice(puzzles, validator.CHUNK))
+        if not chunk:
+            break
+        failed = []
+        groups = {}
+        for i, puzzle in enumerate(chunk, total + 1):
+            if isinstance(puzzle, ex.SudokuException):
+                failed.append((i, str(puzzle)))
+                continue
+            colors = puzzle.colors if args.second else None
+            groups.setdefault((puzzle.order, colors), []).append(
+                (i, puzzle.field))
+        for (order, colors), grids in groups.items():
+            try:
+                ok, unit = validator.validate(
+                    [g for _, g in grids], order, args.first, colors,
+                    not args.partial)
+            except ValueError as e:
+                failed.extend((i, str(e)) for i, _ in grids)
+                continue
+            valid += int(ok.sum())
+            for k in (~ok).nonzero()[0]:
+                failed.append((grids[k][0], validator.describe(
+                    unit[k], order ** 2)))
+        for i, why in sorted(failed):
+            print('Grid {}: {}'.format(i, why))
+        total += len(chunk)
+    print('Valid: {} of {}'.format(valid, total))
+    if valid != total:
+        sys.exit(1)
+
+
+def checkpoint_extra(keys, writer=None, out=None):
+    # сохраняется вместе с позицией перебора: ключи, с которыми он
+    # запущен, и длина файла вывода, где уже есть все отданные решения
+    if writer is not None:
+        writer.flush()
+    return {'keys': keys, 'output': out.tell() if out is not None else None}
+
+
+def need_numpy(module):
+    try:
+        module.require_numpy()
+    except ImportError as e:
+        print(e, file=sys.stderr)
+        sys.exit(2)
+
+
+def benchmark(args):
+    names = args.engines.split(',')
+    unknown = [e for e in names if e not in bench.ENGINES]
+    if unknown:
+        print('Unknown solver: {}'.format(', '.join(unknown)),
+              file=sys.stderr)
+        sys.exit(2)
+    orders = [int(o) for o in args.orders.split(',') if o]
+    report = bench.run(names, orders, args.count, args.seed, args.limit,
+                       not args.no_memory, args.repeat)
+
+    columns = ('puzzles_per_sec', 'first_ms', 'all_ms', 'nodes', 'peak_kb')
+    print('{:10} {:8}'.format('set', 'solver') +
+          ''.join('{:>16}'.format(c) for c in columns))
+    for name, results in report['results'].items():
+        for engine, metrics in results.items():
+            print('{:10} {:8}'.format(name, engine) +
+                  ''.join('{:>16}'.format(str(metrics.get(c, '-')))
+                          for c in columns))
+    if args.output:
+        json.dump(report, args.output, indent=2, sort_keys=True)
+
+    if args.baseline:
+        regressions = bench.compare(report, json.load(args.baseline),
+                                    args.threshold)
+        for line in regressions:
+            print('Regression: ' + line)
+        if regressions:
+            sys.exit(1)
+
+
+async def serve(args):
+    server = SudokuServer(args.workers, args.queue, args.timeout)
+    await server.start(args.host, args.port, args.unix)
+    print('Listening on {}'.format(
+        args.unix or '{}:{}'.format(args.host, args.port)), file=sys.stderr)
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
+
+def p_budget(budget):
+    res = budget.result
+    if res is not None and res.reason != 'solutions':
+        print('Search stopped ({}): {} solutions found, {} nodes, '
+              '{:.2f} s'.format(res.reason, res.solutions, res.nodes,
+                                res.elapsed), file=sys.stderr)
+
+
 def p_sol(sol):
-    max_size = len(str(len(sol))) + 2
-    sudoku = ''
-    for row in sol:
-        for v in row:
-            sudoku += '{0:{1}}'.format(v, max_size)
-        sudoku += '\n'
-    return sudoku
+    return output.format_grid(sol)
 
 
 if __name__ == "__main__":
@@ -1,14 +1,42 @@
+import asyncio
+import io
+import json
 import os
+import pickle
 import sys
+import time
 import pytest
 from itertools import islice
 
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
                              os.path.pardir))
 from model.sudoku_solver import Sudoku
-from model.sudoku_exceptions import SudokuWrongInputError
+from model.sudoku_exceptions import SudokuWrongInputError, \
+    SudokuNoSolutionError, SudokuParseError, \
+    SudokuGeneratorError, SudokuCheckpointError
 from model.sudoku_gen import SudokuGen
+from model.sudoku_grid import Grid
+import model.sudoku_solver_bf as sudoku_solver_bf
+from model.sudoku_solver_bf import SudokuBF, TIE_BREAKS, _template, \
+    _template_size, _templates, clear_template_cache
+from model.sudoku_solver_dlx import SudokuDLX
+from model.sudoku_solver_bitmask import SudokuBitmask
+import model.sudoku_engines as sudoku_engines
+from model.sudoku_solver_simple import SudokuSimple
+from model.sudoku_stats import SolveStats
 from model.utils import str_to_tuples, tuples_to_str
+from model.sudoku_batch import read_puzzles, solve_batch
+from model.sudoku_parser import iter_puzzles, parse_puzzle
+import model.sudoku_validate as sudoku_validate
+import model.sudoku_vector as sudoku_vector
+import model.sudoku_bench as sudoku_bench
+import model.sudoku_output as sudoku_output
+from model.sudoku_budget import Budget, CancelToken
+from model.sudoku_cache import SolutionCache
+from model.sudoku_checkpoint import Checkpoint, load as load_checkpoint
+from model.sudoku_canon import canonical_form, from_canonical
+from model.sudoku_parallel import solve_parallel, count_parallel
+from model.sudoku_server import SudokuServer
 
 _test_dir = os.path.dirname(os.path.abspath(__file__))
 
@@ -85,6 +113,576 @@ def test_16x16_sudoku():
     assert list(s) == list(correct_solution)
 
 
+def test_dlx_same_solutions():
+    for name in ('very_hard', '16x16', 'easy_multiple', '4x4'):
+        s = Sudoku.get_from_file(os.path.join(_test_dir, name + '.txt'))
+        assert sorted(s.solve(SudokuDLX)) == sorted(s.solve())
+
+
+def test_engines():
+    for name in ('very_hard', '16x16', 'easy_multiple', '4x4', 'easy'):
+        s = Sudoku.get_from_file(os.path.join(_test_dir, name + '.txt'))
+        expected = sorted(s.solve())
+        assert sorted(s.solve(SudokuBitmask)) == expected
+        assert sorted(s.solve('auto')) == expected
+        cells = next(s.solve('bitmask', materialize=False))
+        assert s.field.copy().update(cells) in expected
+    s = Sudoku.get_from_file(os.path.join(_test_dir, 'easy_multiple.txt'),
+                             True)
+    assert sorted(s.solve(SudokuBitmask)) == sorted(s.solve())
+    conflict = [[1, 1, 0, 0], [0] * 4, [0] * 4, [0] * 4]
+    assert list(SudokuBitmask(4, 2, conflict).solve()) == []
+
+    assert sudoku_engines.get('dlx') is SudokuDLX
+    with pytest.raises(ValueError):
+        sudoku_engines.get('simple')
+    sparse = Sudoku('\n'.join(['0 0 0 0 0 0 0 0 0'] * 9))
+    full = Sudoku.get_from_file(os.path.join(_test_dir, 'easy_sol.txt'))
+    assert sudoku_engines.get('auto', sparse) is SudokuDLX
+    assert sudoku_engines.get('auto', full) is SudokuBitmask
+    assert 'auto' in sudoku_engines.names()
+
+
+def test_bf_tie_breaks():
+    s = Sudoku.get_from_file(os.path.join(_test_dir, 'easy_multiple.txt'))
+    expected = sorted(s.solve())
+    for tie_break in TIE_BREAKS:
+        assert sorted(s.solve(tie_break=tie_break)) == expected
+    with pytest.raises(ValueError):
+        SudokuBF(s._side, s._order, s._field, 'middle')
+
+
+def test_bf_iterative_same_order():
+    gen = SudokuGen(3, 35)
+    rec = SudokuBF(gen.side, gen.order, gen.table, 'first', False).solve()
+    it = SudokuBF(gen.side, gen.order, gen.table, 'first', True).solve()
+    assert list(islice(rec, 50)) == list(islice(it, 50))
+
+
+def test_bf_template_cache():
+    clear_template_cache()
+    for name in ('easy', 'medium', '4x4', 'hard'):
+        s = Sudoku.get_from_file(os.path.join(_test_dir, name + '.txt'))
+        list(s.solve())
+    assert list(_templates) == [2, 3]
+    assert _template(3) is _templates[3]
+    with pytest.raises(TypeError):
+        _template(3)[0][('rc', (0, 0))] = set()
+
+
+def test_bf_template_cache_evicts_large_orders(monkeypatch):
+    clear_template_cache()
+    monkeypatch.setattr(sudoku_solver_bf, 'TEMPLATE_CACHE_LIMIT',
+                        _template_size(3) + _template_size(2))
+    _template(2)
+    _template(3)
+    assert list(_templates) == [2, 3]
+    _template(4)
+    assert list(_templates) == [4]
+    _template(2)
+    assert list(_templates) == [2]
+    clear_template_cache()
+
+
+def test_grid():
+    rows = [[1, 2, 3, 4], [3, 4, 1, 2], [2, 1, 4, 3], [4, 3, 2, 0]]
+    grid = Grid.from_rows(rows)
+    assert grid.side == 4 and len(grid) == 4
+    assert grid == rows and grid.to_lists() == rows
+    assert list(grid.row(1)) == [3, 4, 1, 2]
+    assert list(grid.col(3)) == [4, 2, 3, 0]
+    assert list(grid.house(3)) == [4, 3, 2, 0]
+    assert grid[3, 2] == 2 and grid[3][2] == 2
+    assert grid.filled()[-1] == (3, 2, 2) and grid.count(0) == 1
+
+    other = grid.copy()
+    other[3, 3] = 1
+    assert grid[3, 3] == 0 and other != grid
+    assert hash(grid.copy()) == hash(grid)
+    assert len({grid, grid.copy(), other}) == 2
+    assert pickle.loads(pickle.dumps(other)) == other
+    assert grid.transposed().to_lists() == [list(c) for c in zip(*rows)]
+    assert grid.relabel({1: 2, 2: 1}).row(0).tolist() == [2, 1, 3, 4]
+    grid.swap_rows(0, 1)
+    assert grid[0] == grid.row(0) and list(grid[0]) == [3, 4, 1, 2]
+
+
+def test_bf_conflicting_givens():
+    field = [[1, 1, 0, 0], [0] * 4, [0] * 4, [0] * 4]
+    assert list(SudokuBF(4, 2, field).solve()) == []
+
+
+def test_count_and_delta():
+    s = Sudoku.get_from_file(os.path.join(_test_dir, 'easy_multiple.txt'))
+    assert s.count() == 2
+    assert s.count(1) == 1
+    assert s.count(solver=SudokuDLX) == 2
+    for sol, cells in zip(s.solve(), s.solve(materialize=False)):
+        field = [list(row) for row in s._field]
+        for r, c, n in cells:
+            assert field[r][c] == 0
+            field[r][c] = n
+        assert field == sol
+
+
+def test_read_puzzles():
+    text = ''
+    for name in ('easy_flat', '4x4', 'invalid_input', 'medium'):
+        with open(os.path.join(_test_dir, name + '.txt')) as f:
+            text += f.read() + '\n\n'
+    text += '# 1,2_3\n' + '0' * 16 + '\n'
+    puzzles = list(read_puzzles(text.splitlines()))
+    assert len(puzzles) == 5
+    assert Sudoku(puzzles[0])._field == Sudoku.get_from_file(
+        os.path.join(_test_dir, 'easy.txt'))._field
+    assert puzzles[1][0] == '# 4x4'
+    assert Sudoku(puzzles[4]).second_colors == ((1, 2), (3,))
+
+
+def test_iter_puzzles(tmpdir):
+    with open(os.path.join(_test_dir, 'easy.txt'), 'rb') as f:
+        easy = f.read()
+    flat = open(os.path.join(_test_dir, 'easy_flat.txt'), 'rb').read()
+    data = flat + b'\n# 1,2_3\n1 2 3 4\n3 4 1 2\n2 1 4 3\n0 . * x\n' + \
+        b'1 2 3 4\n3 4 1 2\n2 1 4 33\n4 3 2 1\n\n' + easy
+    path = tmpdir.join('many.txt')
+    path.write_binary(data)
+    for source in (data, str(path), open(str(path)),
+                   data.decode().split('\n')):
+        puzzles = list(iter_puzzles(source, errors='yield'))
+        assert len(puzzles) == 4
+        assert puzzles[0].field == Sudoku.get_from_file(
+            os.path.join(_test_dir, 'easy.txt'))._field
+        assert puzzles[1].line == 4 and puzzles[1].order == 2
+        assert puzzles[1].colors == ((1, 2), (3,))
+        assert puzzles[1].field.count(0) == 4
+        error = puzzles[2]
+        assert isinstance(error, SudokuParseError)
+        assert (error.line, error.offset) == (10, data.index(b'33'))
+        assert puzzles[3].field == puzzles[0].field
+    with pytest.raises(SudokuParseError):
+        list(iter_puzzles(data))
+
+    empty = tmpdir.join('empty.txt')
+    empty.write('')
+    assert list(iter_puzzles(str(empty))) == []
+    puzzle = parse_puzzle(b'# 0,1_2\n\n1 2 3 4\n\n3 4 1 2\n2 1 4 3\n4 3 2 1')
+    assert puzzle.colors == ((0, 1), (2,)) and puzzle.line == 3
+    assert Sudoku(puzzle).second_colors == ((0, 1), (2,))
+    assert Sudoku(open(os.path.join(_test_dir, '4x4.txt')))._side == 4
+
+
+def test_solve_batch():
+    with open(os.path.join(_test_dir, 'easy_flat.txt')) as f:
+        puzzles = list(read_puzzles(['1' * 81, '0' * 16] + f.readlines()))
+    for workers in (1, 2):
+        results = list(solve_batch(puzzles, 2, workers=workers, chunksize=1))
+        assert [r.index for r in results] == [0, 1, 2]
+        assert results[0].error and not results[0].solutions
+        assert len(results[1].solutions) == 2 and not results[1].error
+        assert results[2].solutions == list(Sudoku.get_from_file(
+            os.path.join(_test_dir, 'easy_sol.txt')).solve())
+
+
+def test_solution_cache(tmpdir):
+    path = str(tmpdir.join('cache.db'))
+    text = '1 2 0 0\n0 0 0 0\n0 0 0 0\n0 0 0 4'
+    s = Sudoku(text)
+    expected = list(s.solve())
+    assert len(expected) == 6
+
+    cache = SolutionCache(path=path)
+    # запись сохраняется, даже если генератор не продолжают после
+    # последнего нужного решения
+    assert list(islice(cache.solve(s, 3), 3)) == expected[:3]
+    assert list(cache.solve(s, 2)) == expected[:2]
+    # -n 5 продолжает перебор закэшированного -n 3 с места остановки:
+    # решения без повторов, но после продолжения порядок может быть другим
+    stats, fresh = SolveStats(), SolveStats()
+    five = list(cache.solve(Sudoku(text, stats=stats), 5))
+    list(islice(Sudoku(text, stats=fresh).solve(), 5))
+    assert five[:3] == expected[:3] and stats.nodes < fresh.nodes
+    assert len(set(five)) == 5 and set(five) <= set(expected)
+    assert (cache.hits, cache.misses) == (1, 2)
+    cache.close()
+
+    cache = SolutionCache(path=path)
+    assert list(cache.solve(s, 5)) == five
+    everything = list(cache.solve(s))
+    assert everything[:5] == five and sorted(everything) == sorted(expected)
+    assert list(cache.solve(s, 100)) == everything
+    assert list(cache.solve(s, materialize=False)) == \
+        [tuple((r, c, n) for r, c, n in sol.filled() if not s._field[r, c])
+         for sol in everything]
+    assert (cache.hits, cache.misses) == (3, 1)
+    assert cache.key(s) != cache.key(s, SudokuDLX)
+    cache.close()
+
+    # давно не использованные записи вытесняются с диска
+    cache = SolutionCache(path=path, max_disk_bytes=1000)
+    other = Sudoku('1 0 0 0\n0 0 0 0\n0 0 2 0\n0 0 0 0')
+    assert len(list(cache.solve(other))) == 18
+    cache.close()
+    cache = SolutionCache(path=path, maxsize=0)
+    assert len(list(cache.solve(other))) == 18
+    assert list(cache.solve(s, 1)) == expected[:1]
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.close()
+
+
+def test_simple_propagation():
+    for name in ('easy', 'hard', '16x16'):
+        s = Sudoku.get_from_file(os.path.join(_test_dir, name + '.txt'))
+        simple = SudokuSimple(s._side, s._order, s._field)
+        assert list(simple.solve()) == list(s.solve())
+
+    s = Sudoku.get_from_file(os.path.join(_test_dir, 'easy_multiple.txt'))
+    simple = SudokuSimple(s._side, s._order, s._field)
+    field = simple.propagate()
+    assert field.count(0) == 4
+    assert all(len(simple.candidates(r, c)) == 2
+               for r in range(9) for c in range(9) if not field[r][c])
+    with pytest.raises(SudokuNoSolutionError):
+        next(SudokuSimple(s._side, s._order, s._field).solve())
+
+    # в последней строке для 2 не остаётся места
+    field = [[0, 0, 0, 0], [0, 0, 0, 0], [2, 0, 0, 0], [0, 1, 3, 4]]
+    with pytest.raises(SudokuNoSolutionError):
+        SudokuSimple(4, 2, field).propagate()
+
+
+def test_presolve_same_solutions():
+    s = Sudoku.get_from_file(os.path.join(_test_dir, 'easy_multiple.txt'))
+    assert sorted(s.solve(presolve=True)) == sorted(s.solve())
+    assert s.count(presolve=True) == 2
+    for delta in s.solve(materialize=False, presolve=True):
+        assert len(delta) == s._field.count(0)
+
+    gen = SudokuGen(3, 50, True, ((0, 1, 2), (40, 41), (80,)))
+    s = Sudoku(gen, True, True)
+    for solver in (SudokuBF, SudokuDLX):
+        assert sorted(s.solve(solver, presolve=True)) == \
+            sorted(s.solve(solver))
+    assert list(Sudoku('1 0 0 0\n0 0 0 0\n2 0 0 0\n0 1 3 4').solve(
+        presolve=True)) == []
+
+
+def test_benchmark():
+    report = sudoku_bench.run(orders=(2,), count=3, memory=False,
+                              repeat=1, names=('4x4',))
+    assert set(report['results']) == {'4x4', 'gen2'}
+    metrics = report['results']['4x4']['bf']
+    assert metrics['puzzles'] == 1 and metrics['solutions'] == 1
+    assert metrics['nodes'] == report['results']['4x4']['dlx']['nodes']
+
+    # тот же seed - те же судоку и то же число узлов
+    again = sudoku_bench.run(('bf',), (2,), 3, memory=False, repeat=1,
+                             names=())
+    assert again['results']['gen2']['bf']['nodes'] == \
+        report['results']['gen2']['bf']['nodes']
+
+    assert sudoku_bench.compare(report, report) == []
+    slower = {'results': {'4x4': {'bf': dict(metrics,
+                                               nodes=metrics['nodes'] * 2,
+                                               all_ms=1000)}}}
+    regressions = sudoku_bench.compare(slower, report)
+    assert len(regressions) == 2
+    assert regressions[0].startswith('4x4 bf all_ms')
+
+
+def test_solve_stats():
+    path = os.path.join(_test_dir, 'very_hard.txt')
+    with open(path) as f:
+        text = f.read()
+    plain = Sudoku(text)
+    for solver in (SudokuBF, SudokuDLX):
+        stats = SolveStats(memory=True)
+        stats.start()
+        s = Sudoku(text, stats=stats)
+        assert list(s.solve(solver)) == list(plain.solve(solver))
+        stats.stop()
+        assert list(stats.phases) == ['parse', 'validity', 'setup', 'search']
+        assert stats.peak and set(stats.peaks) == set(stats.phases)
+        assert stats.solutions == 1
+        assert stats.max_depth == s._field.count(0)
+        assert stats.nodes >= stats.max_depth
+        assert stats.as_dict()['branching'][0] >= 1
+        assert 'Nodes: {}'.format(stats.nodes) in stats.report()
+
+    # оба решения не подходят под первое условие
+    stats = SolveStats()
+    with open(os.path.join(_test_dir, 'easy_multiple.txt')) as f:
+        s = Sudoku(f.read(), True, stats=stats)
+    assert list(s.solve()) == []
+    assert stats.solutions == 0 and stats.discarded == 1
+    assert SudokuBF(9, 3, s._field).stats is None
+
+
+def test_budgets():
+    text = '\n'.join(['0 0 0 0 0 0 0 0 0'] * 9)
+    empty = Sudoku(text)
+    for solver, options in ((SudokuBF, {}), (SudokuBF, {'iterative': False}),
+                            (SudokuDLX, {}), (SudokuBitmask, {})):
+        budget = Budget(max_nodes=500)
+        found = list(empty.solve(solver, budget=budget, **options))
+        assert budget.exhausted and budget.result.reason == 'nodes'
+        assert budget.result.nodes == 500
+        assert budget.result.solutions == len(found) > 0
+
+        budget = Budget(max_solutions=3)
+        assert empty.count(solver=solver, budget=budget, **options) == 3
+        assert budget.result.reason == 'solutions'
+
+        stats = SolveStats()
+        token = CancelToken()
+        budget = Budget(token=token)
+        s = Sudoku(text, stats=stats)
+        for i, _ in enumerate(s.solve(solver, budget=budget, **options)):
+            if i == 9:
+                token.cancel()
+        assert budget.result[:2] == ('cancelled', 10)
+        assert budget.result.stats is stats
+        assert stats.nodes == budget.result.nodes
+
+    budget = Budget(timeout=0.05)
+    assert empty.count(budget=budget) > 0
+    assert budget.result.reason == 'deadline'
+    assert budget.result.elapsed >= 0.05
+
+    # перебор до конца - бюджет не срабатывает
+    budget = Budget(timeout=60, max_nodes=10 ** 6)
+    s = Sudoku.get_from_file(os.path.join(_test_dir, 'easy_multiple.txt'))
+    assert s.count(budget=budget) == 2 and not budget.exhausted
+
+    # остановленный бюджетом перебор не считается в кэше законченным
+    cache = SolutionCache()
+    assert len(list(cache.solve(s, budget=Budget(max_nodes=54)))) == 1
+    assert len(list(cache.solve(s, budget=Budget()))) == 2
+    assert cache.misses == 2
+
+    # судоку, решённая без перебора, тоже учитывается, даже если
+    # генератор закрыт сразу после решения
+    budget = Budget(max_solutions=1)
+    s = Sudoku.get_from_file(os.path.join(_test_dir, 'easy.txt'))
+    assert len(list(islice(s.solve(presolve=True, budget=budget), 1))) == 1
+    assert budget.result[:3] == ('solutions', 1, 0)
+
+
+def test_checkpoint_resume(tmpdir):
+    # перебор останавливается бюджетом или на отданном решении и
+    # продолжается из сохранённой позиции; решения могут идти в другом
+    # порядке, но без повторов и пропусков
+    s = Sudoku('1 0 0 0\n0 0 0 0\n0 0 0 0\n0 0 0 0')
+    full = {frozenset(sol) for sol in s.solve(materialize=False)}
+    path = str(tmpdir.join('search.json'))
+    for max_nodes, per_run in ((7, None), (None, 5)):
+        found = []
+        state = None
+        while state is None or not state['done']:
+            checkpoint = Checkpoint(path, interval=None)
+            solutions = s.solve(materialize=False, resume=state,
+                                budget=Budget(max_nodes=max_nodes),
+                                checkpoint=checkpoint)
+            found += islice(solutions, per_run)
+            assert checkpoint.save()
+            state = load_checkpoint(path)
+            assert state['solutions'] == len(found)
+        assert len(found) == len(full) == 72
+        assert {frozenset(sol) for sol in found} == full
+
+    # позиция сохраняется и по ходу перебора
+    checkpoint = Checkpoint(path, interval=0)
+    checkpoint.CLOCK_EVERY = 1
+    for sol in s.solve(materialize=False, checkpoint=checkpoint):
+        pass
+    assert checkpoint.saves > 1
+
+    other = Sudoku('0 0 0 1\n0 0 0 0\n0 0 0 0\n0 0 0 0')
+    with pytest.raises(SudokuCheckpointError):
+        list(other.solve(resume=load_checkpoint(path)))
+    with open(path, 'w') as f:
+        f.write('{"stack": ')
+    with pytest.raises(SudokuCheckpointError):
+        load_checkpoint(path)
+
+
+def test_parallel_enumeration():
+    s = Sudoku('\n'.join(['0 0 0 0'] * 4))
+    expected = sorted(s.solve())
+    # маленький split_nodes - подзадачи много раз делятся
+    ordered = list(solve_parallel(s, 1, True, split_nodes=7))
+    assert sorted(ordered) == expected
+    assert list(solve_parallel(s, 2, True, split_nodes=7)) == ordered
+    assert sorted(solve_parallel(s, 2, split_nodes=7)) == expected
+    # без деления порядок тот же, что и у SudokuBF
+    assert list(solve_parallel(s, 1, True)) == list(s.solve())
+    assert count_parallel(s, 2, split_nodes=7) == 288
+    assert next(solve_parallel(s, 1, materialize=False)) == \
+        next(s.solve(materialize=False))
+
+    gen = SudokuGen(3, 50, True, ((0, 1, 2), (40, 41), (80,)))
+    s = Sudoku(gen, True, True)
+    assert count_parallel(s, 2, split_nodes=10) == s.count()
+
+
+def test_server(tmpdir):
+    path = str(tmpdir.join('sudoku.sock'))
+    easy = open(os.path.join(_test_dir, 'easy_multiple.txt')).read()
+
+    async def talk(requests):
+        reader, writer = await asyncio.open_unix_connection(path)
+        for req in requests:
+            writer.write(json.dumps(req).encode() + b'\n')
+        await writer.drain()
+        writer.write_eof()
+        replies = []
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            replies.append(json.loads(line))
+        writer.close()
+        return replies
+
+    async def run():
+        server = SudokuServer(workers=1, timeout=10)
+        await server.start(path=path)
+        try:
+            solved = await talk([{'id': 1, 'op': 'solve', 'sudoku': easy,
+                                  'num': -1}])
+            other = await talk([{'id': 2, 'op': 'generate', 'size': 2,
+                                 'percent': 50},
+                                {'id': 3, 'op': 'solve', 'sudoku': 'l 2'},
+                                {'id': 4, 'op': 'nothing'}])
+            # ошибки в запросе и в процессе пула не останавливают сервер
+            bad = await talk([{'id': 5, 'op': 'solve', 'sudoku': easy,
+                               'num': -5},
+                              {'id': 6, 'op': 'solve', 'sudoku': easy,
+                               'timeout': 'soon'},
+                              {'id': 7, 'op': 'solve', 'sudoku': [5]},
+                              {'id': 8, 'op': 'generate', 'size': 5,
+                               'unique': True, 'timeout': 0.01}])
+            health = await talk([{'op': 'health'}])
+            again = await talk([{'id': 9, 'op': 'solve', 'sudoku': easy}])
+        finally:
+            await server.close()
+        return solved, other, health, bad, again
+
+    solved, other, health, bad, again = asyncio.run(run())
+    assert [r['solution'] for r in solved[:-1]] == \
+        list(Sudoku(easy).solve())
+    assert solved[-1] == {'id': 1, 'done': True, 'count': 2,
+                          'stopped': None}
+    other = {r['id']: r for r in other}
+    assert len(other[2]['sudoku']) == 4 and len(other[2]['solution']) == 4
+    assert 'error' in other[3] and 'error' in other[4]
+    bad = {r['id']: r for r in bad}
+    assert all('error' in bad[i] for i in (5, 6, 7, 8))
+    assert 'TypeError' in bad[7]['error']
+    assert 'deadline' in bad[8]['error']
+    assert health[0]['requests'] == 5 and health[0]['errors'] == 6
+    assert health[0]['running'] == 0 and health[0]['queue'] == 0
+    assert again[-1]['done'] and again[-1]['count'] == 1
+
+
+def test_validate_grids():
+    np = pytest.importorskip('numpy')
+    sol = Sudoku.get_from_file(os.path.join(_test_dir, 'easy_sol.txt'))
+    good = sol._field
+    dup = good.copy()
+    dup[4, 0], dup[4, 1] = dup[4, 1], dup[4, 0]
+    empty = good.copy()
+    empty[8, 8] = 0
+    ok, unit = sudoku_validate.validate([good, dup, empty, good.copy()])
+    assert list(ok) == [True, False, False, True]
+    assert sudoku_validate.describe(unit[1], 9) == 'column 1'
+    assert unit[2] == sudoku_validate.CELLS
+    ok, unit = sudoku_validate.validate(
+        np.stack([np.array(good.to_lists())] * 2), complete=False)
+    assert ok.all()
+    assert list(sudoku_validate.validate([empty], 3, complete=False)[0]) \
+        == [True]
+
+    gen = SudokuGen(3, 100, True, ((0, 1), (2, 3, 4)))
+    grids = [gen.ref_table, good]
+    ok, unit = sudoku_validate.validate(grids, 3, True)
+    assert ok[0] and ok[1] == Sudoku._check_first_cond(9, good)
+    colors = ((0, 1), (2, 3, 4))
+    ok, unit = sudoku_validate.validate(grids, 3, colors=colors)
+    assert ok[0] and ok[1] == Sudoku._check_second_cond(good, colors)
+
+
+def test_vectorized_batch():
+    np = pytest.importorskip('numpy')
+    names = ('easy', 'medium', 'very_hard', 'easy_multiple', '4x4',
+             '16x16', 'invalid_input')
+    puzzles = [parse_puzzle(os.path.join(_test_dir, name + '.txt'))
+               for name in names]
+    conflict = parse_puzzle(b'1 2 3 0\n0 0 0 4\n0 0 0 0\n0 0 0 0')
+    values, status = sudoku_vector.propagate(
+        [np.frombuffer(p.field.flat, np.uint8) for p in puzzles[:4]], 3)
+    assert list(status[:2]) == [sudoku_vector.SOLVED] * 2
+    assert status[3] == sudoku_vector.STUCK
+    assert list(sudoku_vector.propagate(
+        [puzzles[6].field.flat], 3)[1]) == [sudoku_vector.INVALID]
+    assert list(sudoku_vector.propagate(
+        [conflict.field.flat], 2)[1]) == [sudoku_vector.CONTRADICTION]
+
+    inputs = puzzles + [conflict, SudokuParseError('bad'),
+                        open(os.path.join(_test_dir, 'hard.txt')).read()]
+    for first_cond in (False, True):
+        got = sorted(sudoku_vector.solve_vectorized(
+            inputs, 3, first_cond, workers=1, chunk=4))
+        expected = list(solve_batch(inputs, 3, first_cond, workers=1))
+        assert [r.index for r in got] == list(range(len(inputs)))
+        for a, b in zip(got, expected):
+            assert sorted(a.solutions) == sorted(b.solutions)
+            assert bool(a.error) == bool(b.error)
+
+
+def test_output_formats(tmpdir):
+    s = Sudoku.get_from_file(os.path.join(_test_dir, 'easy_multiple.txt'))
+    sols = list(s.solve())
+    text = io.StringIO()
+    with sudoku_output.TextWriter(text) as w:
+        for sol in sols:
+            w.write(sol)
+    expected = ''
+    for i, sol in enumerate(sols):
+        expected += 'Solution {}:\n'.format(i + 1)
+        for row in sol:
+            expected += ''.join('{0:3}'.format(v) for v in row) + '\n'
+        expected += '\n'
+    assert text.getvalue() == expected
+
+    big = Sudoku.get_from_file(os.path.join(_test_dir, '16x16.txt'))
+    for sudoku, solutions in ((s, sols), (big, list(big.solve()))):
+        for fmt in ('packed', 'packed-delta'):
+            path = str(tmpdir.join(fmt))
+            with open(path, 'wb') as f:
+                w = sudoku_output.writer(fmt, f, sudoku.field, buffer=1)
+                with w:
+                    for sol in solutions:
+                        w.write(sol)
+            assert list(sudoku_output.iter_packed(path, chunk=7)) == \
+                solutions
+            header = sudoku_output.read_header(open(path, 'rb'))
+            assert header.givens == sudoku.field
+            assert os.path.getsize(path) == 7 + len(sudoku.field) ** 2 + \
+                header.record * len(solutions)
+            if fmt == 'packed':
+                assert header.record == (len(sudoku.field) ** 2 + 1) // 2
+            else:
+                assert header.record == (sudoku.field.count(0) + 1) // 2
+
+    with open(path, 'ab') as f:
+        f.write(b'\x00')
+    with pytest.raises(ValueError):
+        list(sudoku_output.iter_packed(path))
+    with pytest.raises(ValueError):
+        list(sudoku_output.iter_packed(io.BytesIO(b'not packed')))
+
+
 def test_unsolvable_value_not_fit():
     with pytest.raises(SudokuWrongInputError):
         s = Sudoku.get_from_file(os.path.join(
@@ -147,6 +745,107 @@ def test_solve_generated_second_cond():
     assert any(gen.ref_table == sol for sol in s)
 
 
+def test_conditions_pruned_like_filtered():
+    colors = ((0, 1, 2), (40, 41), (80,))
+    gen = SudokuGen(3, 55, True, colors)
+    plain = list(Sudoku(gen).solve())
+    expected = [sol for sol in plain
+                if Sudoku._check_first_cond(gen.side, sol)
+                and Sudoku._check_second_cond(sol, colors)]
+    for solver in (SudokuBF, SudokuDLX):
+        s = Sudoku(gen, True, True).solve(solver)
+        assert sorted(s) == sorted(expected)
+
+
+def test_generate_unique():
+    gen = SudokuGen(3, 35, unique=True)
+    assert sum(1 for row in gen.table for v in row if v) >= 28
+    assert list(Sudoku(gen).solve()) == [gen.ref_table]
+
+    gen = SudokuGen(2, 0, minimal=True)
+    assert list(Sudoku(gen).solve()) == [gen.ref_table]
+    for a in range(gen.side):
+        for b in range(gen.side):
+            if gen.table[a][b]:
+                value, gen.table[a][b] = gen.table[a][b], 0
+                assert Sudoku(gen).count(2) == 2
+                gen.table[a][b] = value
+
+
+def test_generate_unique_first_cond():
+    gen = SudokuGen(3, 30, True, givens=26)
+    assert sum(1 for row in gen.table for v in row if v) >= 26
+    assert list(Sudoku(gen, True).solve()) == [gen.ref_table]
+
+
+def test_generator_conditions_budget():
+    gen = SudokuGen(3, 100, True, ((0, 1, 2), (40, 41), (80,)))
+    assert 0 <= gen.transforms_tried <= gen.max_transforms
+    assert Sudoku._check_first_cond(gen.side, gen.ref_table)
+    assert Sudoku._check_second_cond(gen.ref_table, gen.second_colors)
+
+    with pytest.raises(SudokuGeneratorError) as e:
+        SudokuGen(3, 30, False, ((0,), (0, 1)), max_transforms=500)
+    assert '500 transforms' in str(e.value)
+
+
+def test_generator_lazy_transforms():
+    gen = SudokuGen(3, 100)
+    table = gen._build()
+    assert table == gen.table
+    gen._transpose()
+    assert gen._build() == table.transposed()
+    for _ in range(50):
+        gen._swap_columns_in_house()
+        gen._swap_columns_area()
+        gen._swap_rows_in_house()
+        gen._transpose()
+    table = gen._build()
+    assert table == [[gen._cell(r, c) for c in range(9)] for r in range(9)]
+    assert SudokuBitmask(9, 3, table).count(2) == 1
+    # столбцы переставляются только внутри полос и полосами целиком
+    old = [list(col) for col in table.cols()]
+    gen._swap_columns_in_house()
+    gen._swap_columns_area()
+    moved = [old.index(list(col)) for col in gen._build().cols()]
+    assert all(len({c // 3 for c in moved[i:i + 3]}) == 1
+               for i in range(0, 9, 3))
+
+
+def test_canonical_form():
+    gen = SudokuGen(3, 40)
+    canon, digest, transform = gen.canonical()
+    assert from_canonical(canon, transform) == gen.table
+    assert Sudoku(gen).canonical() == (canon, digest, transform)
+
+    # перестановка полос, строк в полосе, транспонирование и
+    # перенумерация чисел не меняют каноническую форму
+    rows = [3, 5, 4, 0, 1, 2, 8, 6, 7]
+    relabel = [0, 5, 3, 9, 1, 2, 8, 7, 4, 6]
+    field = [[relabel[gen.table[r][c]] for r in rows] for c in range(9)]
+    assert canonical_form(field, 3)[:2] == (canon, digest)
+
+    other = SudokuGen(2, 100).table
+    assert canonical_form(other, 2)[1] != canonical_form(
+        [[1, 2, 3, 4], [3, 4, 1, 2], [2, 1, 4, 3], [4, 3, 2, 0]], 2)[1]
+
+    # разреженные, пустые и заполненные таблицы с множеством симметрий
+    # тоже канонизируются быстро
+    start = time.monotonic()
+    two = [[0] * 9 for _ in range(9)]
+    two[0][0], two[4][5] = 1, 2
+    moved = [[3 - v if v else 0 for v in col]
+             for col in zip(*(two[3:6] + two[:3] + two[6:]))]
+    canon, digest, transform = canonical_form(moved, 3)
+    assert canonical_form(two, 3)[:2] == (canon, digest)
+    assert from_canonical(canon, transform) == moved
+    assert canonical_form([[0] * 9] * 9, 3)[0] == [[0] * 9] * 9
+    full = Sudoku.get_from_file(os.path.join(_test_dir, '16x16_sol.txt'))
+    canonical_form(full._field, 4)
+    canonical_form(SudokuGen(4, 100).table, 4)
+    assert time.monotonic() - start < 10
+
+
 def test_solve_dont_show_same():
     gen = SudokuGen(3, 30)
     s = Sudoku(gen).solve()